@@ -41,6 +41,7 @@ import logging
 import os
 import re
 import sys
+import time
 import unittest
 import zipfile
 
@@ -58,12 +59,24 @@ sys.path = [PARENT_DIR,] + sys.path
 # Look for a zipped copy of Django.
 have_django_zip = False
 django_zip_path = os.path.join(PARENT_DIR, 'django.zip')
+# The importer used for django.zip if it has an index, see zipindex.py.
+django_zip_importer = None
+
+# Precompiled code for the helper, the project and Django, see snapshot.py.
+bytecode_snapshot_path = os.path.join(PARENT_DIR, 'bytecode.snapshot')
+
+# The SDK location found by LoadSdk is saved here to avoid searching for it on
+# every start. Files starting with a '.' are not uploaded by appcfg.py.
+sdk_cache_path = os.path.join(PARENT_DIR, '.appengine_sdk_path')
 
 
 # Flags made available this module
 appid = None
 have_appserver = False
 
+# The phases run by InstallAppengineHelperForDjango, see TimePhase.
+startup_profile = []
+
 # Hide everything other than the flags above and the install function.
 __all__ = ("appid", "have_appserver", "have_django_zip",
            "django_zip_path", "InstallAppengineHelperForDjango")
@@ -78,6 +91,75 @@ def FixPython26Logging():
   logging.logMultiprocessing = 0
 
 
+def ReadSdkCache(cache_path=None):
+  """Returns the SDK paths saved by WriteSdkCache, or None.
+
+  The saved paths are only returned if the SDK directory has not been modified
+  since they were saved.
+  """
+  try:
+    cache = open(cache_path or sdk_cache_path)
+    try:
+      lines = cache.read().splitlines()
+    finally:
+      cache.close()
+    if len(lines) > 1 and repr(os.path.getmtime(lines[1])) == lines[0]:
+      return lines[1:]
+  except (IOError, OSError), e:
+    pass
+  return None
+
+
+def WriteSdkCache(extra_paths, cache_path=None):
+  """Saves the SDK paths along with the modification time of the SDK.
+
+  The first of extra_paths must be the SDK directory. Failures are ignored as
+  the cache is only an optimisation.
+  """
+  try:
+    cache = open(cache_path or sdk_cache_path, "w")
+    try:
+      cache.write("\n".join([repr(os.path.getmtime(extra_paths[0]))] +
+                            extra_paths) + "\n")
+    finally:
+      cache.close()
+  except (IOError, OSError), e:
+    logging.debug("Unable to save the SDK location: %s" % e)
+
+
+def FindSdk():
+  """Searches the known install locations for the SDK and returns its path."""
+  # Build a list of alternative paths where it may be. First look within the
+  # project for a local copy, then look for where the Mac OS SDK installs it.
+  paths = [os.path.join(PARENT_DIR, '.google_appengine'),
+           os.path.join(PARENT_DIR, 'google_appengine'),
+           '/usr/local/google_appengine']
+  # Then if on windows, look for where the Windows SDK installed it.
+  for path in os.environ.get('PATH', '').split(';'):
+    path = path.rstrip('\\')
+    if path.endswith('google_appengine'):
+      paths.append(path)
+  try:
+    from win32com.shell import shell
+    from win32com.shell import shellcon
+    id_list = shell.SHGetSpecialFolderLocation(
+        0, shellcon.CSIDL_PROGRAM_FILES)
+    program_files = shell.SHGetPathFromIDList(id_list)
+    paths.append(os.path.join(program_files, 'Google',
+                              'google_appengine'))
+  except ImportError, e:
+    # Not windows.
+    pass
+  # Loop through all possible paths and look for the SDK dir.
+  for sdk_path in paths:
+    if os.path.exists(sdk_path):
+      return os.path.realpath(sdk_path)
+  # The SDK could not be found in any known location.
+  sys.stderr.write("The Google App Engine SDK could not be found!\n")
+  sys.stderr.write("See README for installation instructions.\n")
+  sys.exit(1)
+
+
 def LoadSdk():
   # Try to import the appengine code from the system path.
   try:
@@ -86,55 +168,28 @@ def LoadSdk():
     # Hack to fix reports of import errors on Ubuntu 9.10.
     if 'google' in sys.modules:
       del sys.modules['google']
-    # Not on the system path. Build a list of alternative paths where it may be.
-    # First look within the project for a local copy, then look for where the Mac
-    # OS SDK installs it.
-    paths = [os.path.join(PARENT_DIR, '.google_appengine'),
-             os.path.join(PARENT_DIR, 'google_appengine'),
-             '/usr/local/google_appengine']
-    # Then if on windows, look for where the Windows SDK installed it.
-    for path in os.environ.get('PATH', '').split(';'):
-      path = path.rstrip('\\')
-      if path.endswith('google_appengine'):
-        paths.append(path)
-    try:
-      from win32com.shell import shell
-      from win32com.shell import shellcon
-      id_list = shell.SHGetSpecialFolderLocation(
-          0, shellcon.CSIDL_PROGRAM_FILES)
-      program_files = shell.SHGetPathFromIDList(id_list)
-      paths.append(os.path.join(program_files, 'Google',
-                                'google_appengine'))
-    except ImportError, e:
-      # Not windows.
-      pass
-    # Loop through all possible paths and look for the SDK dir.
-    SDK_PATH = None
-    for sdk_path in paths:
-      if os.path.exists(sdk_path):
-        SDK_PATH = os.path.realpath(sdk_path)
-        break
-    if SDK_PATH is None:
-      # The SDK could not be found in any known location.
-      sys.stderr.write("The Google App Engine SDK could not be found!\n")
-      sys.stderr.write("See README for installation instructions.\n")
-      sys.exit(1)
-    if SDK_PATH == os.path.join(PARENT_DIR, 'google_appengine'):
+    # Not on the system path. Use the location found by an earlier start if
+    # the SDK has not changed since, otherwise search for it.
+    EXTRA_PATHS = ReadSdkCache()
+    if EXTRA_PATHS is None:
+      SDK_PATH = FindSdk()
+      # Add the SDK and the libraries within it to the system path.
+      EXTRA_PATHS = [
+          SDK_PATH,
+          os.path.join(SDK_PATH, 'lib', 'antlr3'),
+          os.path.join(SDK_PATH, 'lib', 'django'),
+          os.path.join(SDK_PATH, 'lib', 'ipaddr'),
+          os.path.join(SDK_PATH, 'lib', 'webob'),
+          os.path.join(SDK_PATH, 'lib', 'yaml', 'lib'),
+          os.path.join(SDK_PATH, 'lib', 'fancy_urllib'),
+      ]
+      WriteSdkCache(EXTRA_PATHS)
+    if EXTRA_PATHS[0] == os.path.join(PARENT_DIR, 'google_appengine'):
       logging.warn('Loading the SDK from the \'google_appengine\' subdirectory '
                    'is now deprecated!')
       logging.warn('Please move the SDK to a subdirectory named '
                    '\'.google_appengine\' instead.')
       logging.warn('See README for further details.')
-    # Add the SDK and the libraries within it to the system path.
-    EXTRA_PATHS = [
-        SDK_PATH,
-        os.path.join(SDK_PATH, 'lib', 'antlr3'),
-        os.path.join(SDK_PATH, 'lib', 'django'),
-        os.path.join(SDK_PATH, 'lib', 'ipaddr'),
-        os.path.join(SDK_PATH, 'lib', 'webob'),
-        os.path.join(SDK_PATH, 'lib', 'yaml', 'lib'),
-        os.path.join(SDK_PATH, 'lib', 'fancy_urllib'),
-    ]
     # Add SDK paths at the start of sys.path, but after the local directory which
     # was added to the start of sys.path on line 50 above. The local directory
     # must come first to allow the local imports to override the SDK and
@@ -142,8 +197,22 @@ def LoadSdk():
     sys.path = sys.path[0:1] + EXTRA_PATHS + sys.path[1:]
 
 
+def LoadBytecodeSnapshot():
+  """Imports modules from the bytecode snapshot if one has been built.
+
+  Modules whose source has changed since the snapshot was built are compiled
+  from source as usual.
+  """
+  from appengine_django import snapshot
+  importer = snapshot.load_snapshot(bytecode_snapshot_path)
+  if importer is not None:
+    sys.meta_path.append(importer)
+    logging.debug("Loaded %d modules from the bytecode snapshot" %
+                  len(importer.index))
+
+
 def LoadDjango(version=None):
-  global have_django_zip
+  global have_django_zip, django_zip_importer
 
   from google.appengine.dist import use_library
   from google.appengine.dist._library import UnacceptableVersionError
@@ -158,7 +227,13 @@ def LoadDjango(version=None):
 
   if os.path.exists(django_zip_path):
     have_django_zip = True
-    sys.path.insert(1, django_zip_path)
+    # Import from the archive using its index if one has been built, unless a
+    # local copy of Django would take precedence over the archive.
+    if not os.path.exists(os.path.join(PARENT_DIR, 'django')):
+      from appengine_django import zipindex
+      django_zip_importer = zipindex.install(django_zip_path)
+    if django_zip_importer is None:
+      sys.path.insert(1, django_zip_path)
 
   # Remove the standard version of Django if a local copy has been provided.
   if have_django_zip or os.path.exists(os.path.join(PARENT_DIR, 'django')):
@@ -326,11 +401,18 @@ def PatchDeserializedObjectClass():
   contain a FakeParent class that is used to deserialize instances without
   needing to load the parent instance itself. See the PythonDeserializer for
   more details.
+
+  While a bulk loader is active the object is instead buffered to be saved
+  in a batch, see appengine_django.bulkload.
   """
   # This can't be imported until InstallAppengineDatabaseBackend has run.
   from django.core.serializers import base
+  from appengine_django import bulkload
   class NewDeserializedObject(base.DeserializedObject):
     def save(self, save_m2m=True, using=None):
+      if bulkload.active_loader is not None:
+        bulkload.active_loader.add(self.object)
+        return
       self.object.save()
       self.object._parent = None
   base.DeserializedObject = NewDeserializedObject
@@ -435,26 +517,44 @@ def FindCommandsInZipfile(management_dir):
     Given a path to a management directory, returns a list of all the command
     names that are available.
 
-    This implementation also works when Django is loaded from a zip.
+    This implementation also works when Django is loaded from a zip. The
+    commands found in a zip are cached, and are read from the zip's index if
+    it has one.
 
     Returns an empty list if no commands are defined.
     """
     zip_marker = ".zip%s" % os.sep
     if zip_marker not in management_dir:
       return FindCommandsInZipfile.orig(management_dir)
-
-    # Django is sourced from a zipfile, ask zip module for a list of files.
-    filename, path = management_dir.split(zip_marker)
-    zipinfo = zipfile.ZipFile("%s.zip" % filename)
-
-    # Add commands directory to management path.
-    path = os.path.join(path, "commands")
+    if management_dir in FindCommandsInZipfile.cache:
+      return list(FindCommandsInZipfile.cache[management_dir])
 
     # The zipfile module returns paths in the format of the operating system
     # that created the zipfile! This may not match the path to the zipfile
     # itself. Convert operating system specific characters to a standard
     # character (#) to compare paths to work around this.
     path_normalise = re.compile(r"[/\\]")
+    filename, path = management_dir.split(zip_marker)
+    if (django_zip_importer is not None and
+        django_zip_importer.archive == "%s.zip" % filename):
+      commands = django_zip_importer.commands.get(
+          path_normalise.sub("/", path).rstrip("/"), [])
+    else:
+      commands = ListCommandsInZipfile("%s.zip" % filename, path,
+                                       path_normalise)
+    FindCommandsInZipfile.cache[management_dir] = commands
+    return list(commands)
+
+FindCommandsInZipfile.cache = {}
+
+
+def ListCommandsInZipfile(filename, path, path_normalise):
+    """Returns the names of the commands in the zipfile's path directory."""
+    # Django is sourced from a zipfile, ask zip module for a list of files.
+    zipinfo = zipfile.ZipFile(filename)
+
+    # Add commands directory to management path.
+    path = os.path.join(path, "commands")
     path = path_normalise.sub("#", path)
     def _IsCmd(t):
       """Returns true if t matches the criteria for a command module."""
@@ -506,11 +606,112 @@ def InstallReplacementThreadingModule():
   logging.debug("Installed replacement threading module")
 
 
-def InstallAppengineHelperForDjango(version=None):
+class LazyInstaller(object):
+  """Import hook that runs installers the first time a module is imported.
+
+  The hook sits on sys.meta_path while installers are pending. It does not
+  load any modules itself, it lets the normal import machinery load the
+  module and then runs the installers registered for it before the importing
+  code sees the module.
+  """
+
+  def __init__(self):
+    self._pending = {}
+    self._loading = []
+
+  def register(self, module_name, installer):
+    """Runs installer once module_name has been imported."""
+    if module_name in sys.modules:
+      installer()
+      return
+    self._pending.setdefault(module_name, []).append(installer)
+    if self not in sys.meta_path:
+      sys.meta_path.insert(0, self)
+
+  def find_module(self, fullname, path=None):
+    if fullname in self._pending and fullname not in self._loading:
+      return self
+    return None
+
+  def load_module(self, fullname):
+    self._loading.append(fullname)
+    try:
+      __import__(fullname)
+    finally:
+      self._loading.remove(fullname)
+    module = sys.modules[fullname]
+    for installer in self._pending.pop(fullname, []):
+      installer()
+    if not self._pending and self in sys.meta_path:
+      sys.meta_path.remove(self)
+    return module
+
+
+lazy_installer = LazyInstaller()
+
+
+def InstallLazily(settings):
+  """Defers the installers that only some requests need.
+
+  The serialization, ModelForm, mail, authentication and management command
+  patches are applied when the Django module they patch is first imported
+  rather than when the helper is installed.
+  """
+  lazy_installer.register("django.forms", InstallModelForm)
+  lazy_installer.register("django.core.serializers",
+                          lambda: PatchDjangoSerializationModules(settings))
+  lazy_installer.register("django.core.management", ModifyAvailableCommands)
+  lazy_installer.register("django.core.mail", InstallGoogleSMTPConnection)
+  lazy_installer.register("django.contrib.auth",
+                          lambda: InstallAuthentication(settings))
+  logging.debug("Deferred installation of optional patches")
+
+
+def TimePhase(func, *args):
+  """Runs one phase of the helper installation and records its cost.
+
+  A dictionary describing the phase is appended to startup_profile with the
+  following keys:
+    phase: The name of the function that was run.
+    seconds: The wall time the phase took.
+    modules: A sorted list of the modules imported during the phase.
+
+  Returns:
+    The return value of func.
+  """
+  before = set(sys.modules)
+  start = time.time()
+  result = func(*args)
+  elapsed = time.time() - start
+  modules = [m for m in sys.modules if m not in before and sys.modules[m]]
+  modules.sort()
+  startup_profile.append({"phase": func.__name__, "seconds": elapsed,
+                          "modules": modules})
+  return result
+
+
+def LogStartupProfile():
+  """Logs the startup profile as a single JSON encoded record.
+
+  Nothing is done unless debug logging is enabled, so that cold starts do not
+  pay for importing simplejson and encoding the profile.
+  """
+  if not logging.getLogger().isEnabledFor(logging.DEBUG):
+    return
+  from django.utils import simplejson
+  logging.debug("Helper startup profile: %s" %
+                simplejson.dumps(startup_profile))
+
+
+def InstallAppengineHelperForDjango(version=None, lazy=False):
   """Installs and Patches all of the classes/methods required for integration.
 
   If the variable DEBUG_APPENGINE_DJANGO is set in the environment verbose
   logging of the actions taken will be enabled.
+
+  If lazy is True the patches that are only needed by some requests are
+  applied when the module they patch is first imported, see InstallLazily.
+  This reduces the time taken to start a new instance.
   """
   global INSTALLED
   if INSTALLED:
@@ -518,9 +719,10 @@ def InstallAppengineHelperForDjango(version=None):
                     "process (not going to reinstall)")
     return
 
-  FixPython26Logging()
-  LoadSdk()
-  LoadDjango(version)
+  TimePhase(FixPython26Logging)
+  TimePhase(LoadBytecodeSnapshot)
+  TimePhase(LoadSdk)
+  TimePhase(LoadDjango, version)
 
   from django import VERSION
   from django.conf import settings
@@ -543,18 +745,26 @@ def InstallAppengineHelperForDjango(version=None):
   # Force Django to reload its settings.
   settings._target = None
 
-  LoadAppengineEnvironment()
-  InstallReplacementImpModule()
-  InstallReplacementThreadingModule()
-  InstallAppengineDatabaseBackend()
-  InstallModelForm()
-  InstallGoogleMemcache()
-  InstallDjangoModuleReplacements()
-  PatchDjangoSerializationModules(settings)
-  CleanupDjangoSettings(settings)
-  ModifyAvailableCommands()
-  InstallGoogleSMTPConnection()
-  InstallAuthentication(settings)
+  TimePhase(LoadAppengineEnvironment)
+  TimePhase(InstallReplacementImpModule)
+  TimePhase(InstallReplacementThreadingModule)
+  TimePhase(InstallAppengineDatabaseBackend)
+  if lazy:
+    TimePhase(InstallGoogleMemcache)
+    TimePhase(InstallDjangoModuleReplacements)
+    TimePhase(CleanupDjangoSettings, settings)
+    TimePhase(InstallLazily, settings)
+  else:
+    TimePhase(InstallModelForm)
+    TimePhase(InstallGoogleMemcache)
+    TimePhase(InstallDjangoModuleReplacements)
+    TimePhase(PatchDjangoSerializationModules, settings)
+    TimePhase(CleanupDjangoSettings, settings)
+    TimePhase(ModifyAvailableCommands)
+    TimePhase(InstallGoogleSMTPConnection)
+    TimePhase(InstallAuthentication, settings)
+  TimePhase(InstallRPCProfiler)
+  LogStartupProfile()
 
   logging.debug("Successfully loaded the Google App Engine Helper for Django.")
   INSTALLED = True
@@ -594,6 +804,17 @@ def InstallAuthentication(settings):
     logging.debug("No Django authentication support available")
 
 
+def InstallRPCProfiler():
+  """Installs the apiproxy hooks used by the RPC profiling middleware.
+
+  The hooks only record calls while a profile is active, see
+  appengine_django.profiler for details.
+  """
+  from appengine_django import profiler
+  profiler.install_hooks()
+  logging.debug("Installed RPC profiling hooks")
+
+
 def InstallModelForm():
   """Replace Django ModelForm with the AppEngine ModelForm."""
   # This MUST happen as early as possible, but after any auth model patching.
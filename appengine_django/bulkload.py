@@ -0,0 +1,129 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batched saving of deserialized objects.
+
+While a BulkLoader is active, deserialized objects (eg. those loaded by
+./manage.py loaddata) are buffered rather than saved one at a time, and are
+saved with one datastore put per batch. When the SDK supports asynchronous
+puts several batches are saved concurrently.
+
+  loader = bulkload.start(batch_size=100)
+  try:
+    ... deserialize and save objects ...
+  finally:
+    bulkload.finish()
+"""
+
+import time
+
+from google.appengine.ext import db
+
+from appengine_django import entitycache
+
+
+DEFAULT_BATCH_SIZE = 100
+
+# The number of asynchronous puts that may be in progress at once.
+DEFAULT_MAX_IN_FLIGHT = 4
+
+# The loader that deserialized objects are added to, if any.
+active_loader = None
+
+
+class BulkLoader(object):
+  """Saves entities in batches, with several batches in flight at once."""
+
+  def __init__(self, batch_size=DEFAULT_BATCH_SIZE,
+               max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    self.batch_size = batch_size
+    self.max_in_flight = max_in_flight
+    self.count = 0
+    self.puts = 0
+    self.start_time = time.time()
+    self._buffer = []
+    self._in_flight = []
+
+  def add(self, entity):
+    """Buffers an entity, saving the buffer once it holds a full batch."""
+    self._buffer.append(entity)
+    if len(self._buffer) >= self.batch_size:
+      self._put_buffer()
+
+  def _put_buffer(self):
+    batch = self._buffer
+    self._buffer = []
+    self.puts += 1
+    put_async = getattr(db, "put_async", None)
+    if put_async is None:
+      db.put(batch)
+      self._saved(batch)
+      return
+    while len(self._in_flight) >= self.max_in_flight:
+      self._wait()
+    self._in_flight.append((put_async(batch), batch))
+
+  def _wait(self):
+    rpc, batch = self._in_flight.pop(0)
+    rpc.get_result()
+    self._saved(batch)
+
+  def _saved(self, batch):
+    cached_keys = []
+    for entity in batch:
+      # Deserialized objects may have a placeholder parent, see
+      # serializer/python.py.
+      entity._parent = None
+      if getattr(entity, "cache_entities", False):
+        cached_keys.append(entity.key())
+    if cached_keys:
+      entitycache.invalidate(cached_keys)
+    self.count += len(batch)
+
+  def flush(self):
+    """Saves any buffered entities and waits for all puts to complete."""
+    if self._buffer:
+      self._put_buffer()
+    while self._in_flight:
+      self._wait()
+
+  def rate(self):
+    """Returns the number of entities saved per second so far."""
+    elapsed = time.time() - self.start_time
+    if not elapsed:
+      return 0.0
+    return self.count / elapsed
+
+
+def start(**kwargs):
+  """Starts buffering deserialized objects, see BulkLoader for arguments."""
+  global active_loader
+  active_loader = BulkLoader(**kwargs)
+  return active_loader
+
+
+def finish():
+  """Saves the buffered objects and stops buffering.
+
+  Returns:
+    The BulkLoader that was active.
+  """
+  global active_loader
+  loader = active_loader
+  active_loader = None
+  if loader is not None:
+    loader.flush()
+  return loader
@@ -130,6 +130,9 @@ class DatabaseWrapper(BaseDatabaseWrapper):
     args['datastore_path'], args['history_path'] = self._get_paths()
     from google.appengine.tools import dev_appserver
     dev_appserver.SetupStubs(appid, **args)
+    # SetupStubs replaces the apiproxy, reinstall the profiling hooks.
+    from appengine_django import profiler
+    profiler.install_hooks()
     if self.use_test_datastore:
       logging.debug("Configured API stubs for the test datastore")
     else:
@@ -0,0 +1,162 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A two tier read-through cache for entities fetched by key.
+
+Models opt in by setting cache_entities on the class:
+
+  class Config(BaseModel):
+    cache_entities = True
+
+Model.get and Model.get_by_key_name then look for each entity first in a
+dictionary local to the current request, then in memcache, and finally in the
+datastore. Both tiers store entities as encoded protocol buffers, so every
+read returns a new model instance and changes made to one instance without
+saving it are not seen by other readers. The local tier also records keys
+that have no entity. It is only used between the request_started and
+request_finished signals. Reads made inside a transaction bypass both tiers.
+
+Entities are removed from both tiers when they are saved or deleted with put()
+or delete(), or with the model manager's bulk methods, and memcache will not
+accept them again for INVALIDATION_LOCK_TIME seconds. This stops a read that
+raced with the write from caching the entity it read before the write.
+Entities saved or deleted with db.put or db.delete are not removed.
+
+The number of hits in each tier and of misses are counted in stats.
+"""
+
+import threading
+
+from google.appengine.api import datastore
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import db
+
+from django.core import signals
+
+
+KEY_PREFIX = "appengine_django.entity:"
+
+# The number of seconds entities are kept in memcache.
+MEMCACHE_TIME = 3600
+
+# The number of seconds after an entity is invalidated during which it will
+# not be added to memcache.
+INVALIDATION_LOCK_TIME = 5
+
+stats = {"local_hits": 0, "memcache_hits": 0, "misses": 0}
+
+_local = threading.local()
+
+
+def _local_cache():
+  """Returns the cache local to the current request, or None."""
+  return getattr(_local, "entities", None)
+
+
+def clear_local_cache(**kwargs):
+  """Starts a new, empty cache local to the current request."""
+  _local.entities = {}
+
+signals.request_started.connect(clear_local_cache)
+
+
+def release_local_cache(**kwargs):
+  """Discards the local cache at the end of the request."""
+  _local.entities = None
+
+signals.request_finished.connect(release_local_cache)
+
+
+def in_transaction():
+  """Returns True if a datastore transaction is active in this thread."""
+  is_in_transaction = getattr(db, "is_in_transaction", None)
+  if is_in_transaction is not None:
+    return is_in_transaction()
+  # Older SDKs only record the current transaction privately.
+  return bool(datastore._CurrentTransactionKey())
+
+
+def _decode(data):
+  if data is None:
+    return None
+  return db.model_from_protobuf(entity_pb.EntityProto(data))
+
+
+def get(keys):
+  """Returns the entities for keys, using the cache where possible.
+
+  Args:
+    keys: A list of db.Key instances.
+
+  Returns:
+    A list of the entities, with None for any keys without an entity.
+  """
+  if in_transaction():
+    return db.get(keys)
+  local = _local_cache()
+  if local is None:
+    # Outside of a request entities are only cached in memcache.
+    local = {}
+  # Maps each name to the encoded entity, or None if there is no entity.
+  found = {}
+  names = [str(key) for key in keys]
+  missing = []
+  for name in names:
+    if name in local:
+      found[name] = local[name]
+      stats["local_hits"] += 1
+    else:
+      missing.append(name)
+  if missing:
+    cached = memcache.get_multi(missing, key_prefix=KEY_PREFIX)
+    stats["memcache_hits"] += len(cached)
+    found.update(cached)
+    local.update(cached)
+    missing = [name for name in missing if name not in cached]
+  entities = {}
+  if missing:
+    stats["misses"] += len(missing)
+    to_store = {}
+    for name, entity in zip(missing, db.get([db.Key(n) for n in missing])):
+      # The entity read from the datastore is returned as is, a copy is
+      # decoded for any later reads.
+      entities[name] = entity
+      data = None
+      if entity is not None:
+        data = to_store[name] = db.model_to_protobuf(entity).Encode()
+      found[name] = local[name] = data
+    if to_store:
+      # add rather than set, so that entities invalidated since they were
+      # read are not stored.
+      memcache.add_multi(to_store, MEMCACHE_TIME, key_prefix=KEY_PREFIX)
+  result = []
+  for name in names:
+    if name in entities:
+      result.append(entities.pop(name))
+    else:
+      result.append(_decode(found[name]))
+  return result
+
+
+def invalidate(keys):
+  """Removes the entities for keys from both tiers of the cache."""
+  names = [str(key) for key in keys]
+  local = _local_cache()
+  if local is not None:
+    for name in names:
+      local.pop(name, None)
+  memcache.delete_multi(names, INVALIDATION_LOCK_TIME, key_prefix=KEY_PREFIX)
@@ -0,0 +1,191 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+import os
+import pickle
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+from optparse import make_option
+
+from google.appengine.ext import db
+
+from appengine_django import appid
+from appengine_django.sessions.layouts import LAYOUTS
+from appengine_django.sessions.models import Session
+
+from django.core.management.base import BaseCommand
+
+
+# The number of session keys deleted per datastore RPC.
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_checkpoint_path():
+  """Returns the default path of the checkpoint file for this application."""
+  return os.path.join(tempfile.gettempdir(),
+                      "django_%s.cleanup_sessions" % appid)
+
+
+def read_checkpoint(path):
+  """Returns the (cutoff, cursor) tuple saved at path or None.
+
+  None is also returned if the checkpoint cannot be decoded, eg. because the
+  write was interrupted.
+  """
+  if not os.path.exists(path):
+    return None
+  f = open(path, "rb")
+  try:
+    data = f.read()
+  finally:
+    f.close()
+  try:
+    return pickle.loads(data)
+  except (EOFError, pickle.UnpicklingError):
+    return None
+
+
+def write_checkpoint(path, cutoff, cursor):
+  """Saves the progress of a sweep so that it can be resumed."""
+  f = open(path, "wb")
+  try:
+    pickle.dump((cutoff, cursor), f)
+  finally:
+    f.close()
+
+
+def delete_expired_sessions(cutoff=None, cursor=None,
+                            batch_size=DEFAULT_BATCH_SIZE, checkpoint=None):
+  """Deletes every session that expired before cutoff.
+
+  Sessions are found with keys only queries ordered by expire_date and are
+  deleted one batch per datastore RPC. The query cursor is passed to the
+  checkpoint function after each batch so that an interrupted sweep can be
+  resumed by passing the same cutoff and the last cursor back in.
+
+  Args:
+    cutoff: Sessions expiring before this datetime are deleted. Defaults to
+      the current time.
+    cursor: A query cursor to resume a previous sweep from.
+    batch_size: The number of sessions to delete per RPC.
+    checkpoint: An optional function called as checkpoint(cutoff, cursor)
+      after each batch has been deleted.
+
+  Returns:
+    The number of sessions deleted.
+  """
+  if cutoff is None:
+    cutoff = datetime.now()
+  deleted = 0
+  while True:
+    query = Session.all(keys_only=True)
+    query.filter("expire_date <", cutoff).order("expire_date")
+    if cursor:
+      query.with_cursor(cursor)
+    keys = query.fetch(batch_size)
+    if not keys:
+      break
+    db.delete(keys)
+    deleted += len(keys)
+    cursor = query.cursor()
+    if checkpoint:
+      checkpoint(cutoff, cursor)
+    logging.debug("Deleted %d expired sessions" % deleted)
+    if len(keys) < batch_size:
+      break
+  return deleted
+
+
+def delete_session_buckets(before, batch_size=DEFAULT_BATCH_SIZE):
+  """Deletes every session in an hourly bucket created before a datetime.
+
+  Only sessions stored with the 'hourly' key layout are affected. Whole
+  buckets are removed with a key range scan regardless of the expiry dates
+  of the sessions inside them, so before must be older than the longest
+  lifetime a session is allowed to have.
+
+  Args:
+    before: Buckets for hours starting before this datetime are deleted.
+    batch_size: The number of sessions to delete per RPC.
+
+  Returns:
+    The number of sessions deleted.
+  """
+  start, end = LAYOUTS["hourly"].bucket_range(before)
+  deleted = 0
+  while True:
+    query = Session.all(keys_only=True)
+    query.filter("__key__ >=", db.Key.from_path(Session.kind(), start))
+    query.filter("__key__ <", db.Key.from_path(Session.kind(), end))
+    keys = query.fetch(batch_size)
+    if not keys:
+      break
+    db.delete(keys)
+    deleted += len(keys)
+    logging.debug("Deleted %d bucketed sessions" % deleted)
+    if len(keys) < batch_size:
+      break
+  return deleted
+
+
+class Command(BaseCommand):
+  """Deletes expired sessions from the datastore.
+
+  Progress is recorded in a checkpoint file after every batch. If the command
+  is interrupted the next run resumes the sweep from the last checkpoint.
+
+  With --max-age, hourly session buckets older than the given number of hours
+  are also dropped (see appengine_django.sessions.layouts).
+  """
+  help = 'Deletes expired sessions from the datastore.'
+  option_list = BaseCommand.option_list + (
+      make_option('--batch-size', dest='batch_size', type='int',
+                  default=DEFAULT_BATCH_SIZE,
+                  help='Number of sessions deleted per datastore RPC.'),
+      make_option('--checkpoint', dest='checkpoint', default=None,
+                  help='File used to record progress so that an interrupted '
+                       'run can be resumed.'),
+      make_option('--restart', dest='restart', action='store_true',
+                  default=False,
+                  help='Ignore any existing checkpoint and start a new '
+                       'sweep.'),
+      make_option('--max-age', dest='max_age', type='int', default=None,
+                  help='Also delete hourly session buckets created more than '
+                       'this many hours ago.'),
+  )
+
+  def handle(self, *args, **options):
+    path = options.get('checkpoint') or get_checkpoint_path()
+    cutoff, cursor = None, None
+    if not options.get('restart'):
+      saved = read_checkpoint(path)
+      if saved:
+        cutoff, cursor = saved
+        logging.info("Resuming session cleanup from %s" % path)
+    deleted = delete_expired_sessions(
+        cutoff, cursor, options.get('batch_size', DEFAULT_BATCH_SIZE),
+        lambda cutoff, cursor: write_checkpoint(path, cutoff, cursor))
+    if os.path.exists(path):
+      os.remove(path)
+    if options.get('max_age') is not None:
+      before = datetime.now() - timedelta(hours=options['max_age'])
+      deleted += delete_session_buckets(
+          before, options.get('batch_size', DEFAULT_BATCH_SIZE))
+    if int(options.get('verbosity', 1)) > 0:
+      print "Deleted %d expired sessions." % deleted
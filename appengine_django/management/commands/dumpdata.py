@@ -0,0 +1,102 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import codecs
+import itertools
+import sys
+from optparse import make_option
+
+from django.core import serializers
+from django.core.management.base import CommandError
+from django.core.management.commands import dumpdata
+from django.db.models import get_app
+from django.db.models import get_apps
+from django.db.models import get_model
+from django.db.models import get_models
+
+from appengine_django.models import ModelManager
+from appengine_django.query import DEFAULT_BATCH_SIZE
+from appengine_django.serializer import streaming
+
+
+def get_dump_models(app_labels, exclude=()):
+  """Returns the models named by app_labels, as dumpdata selects them.
+
+  Args:
+    app_labels: A list of app labels or app_label.ModelName strings. All apps
+      are used if the list is empty.
+    exclude: A list of app labels to leave out.
+  """
+  excluded = [get_app(label) for label in exclude]
+  if not app_labels:
+    return [m for app in get_apps() if app not in excluded
+            for m in get_models(app)]
+  models = []
+  for label in app_labels:
+    if "." in label:
+      app_label, model_label = label.split(".", 1)
+      model = get_model(app_label, model_label)
+      if model is None:
+        raise CommandError("Unknown model: %s" % label)
+      selected = [model]
+    else:
+      selected = get_models(get_app(label))
+    models.extend([m for m in selected if m not in models])
+  return models
+
+
+def get_dump_objects(model, batch_size=DEFAULT_BATCH_SIZE):
+  """Returns an iterable of the entities of model to dump.
+
+  Models using the helper's ModelManager are fetched in batches of batch_size
+  using query cursors. Other managers are dumped with all(), as Django does.
+  """
+  manager = model._default_manager
+  if isinstance(manager, ModelManager):
+    return manager.get_query_set().with_batch_size(batch_size)
+  return manager.all()
+
+
+class Command(dumpdata.Command):
+  """Dumps datastore models, writing each entity as it is fetched.
+
+  Entities are fetched in batches using query cursors and serialized one at a
+  time, so any number of entities can be dumped in constant memory.
+  """
+  option_list = dumpdata.Command.option_list + (
+      make_option('--batch-size', dest='batch_size', type='int',
+                  default=DEFAULT_BATCH_SIZE,
+                  help='Number of entities fetched per datastore query.'),
+  )
+
+  def handle(self, *app_labels, **options):
+    format = options.get('format', 'json')
+    if format not in serializers.get_public_serializer_formats():
+      raise CommandError("Unknown serialization format: %s" % format)
+    models = get_dump_models(app_labels, options.get('exclude', []))
+    batch_size = options.get('batch_size', DEFAULT_BATCH_SIZE)
+    objects = itertools.chain(*[get_dump_objects(m, batch_size)
+                                for m in models])
+    stream = codecs.getwriter("utf-8")(sys.stdout)
+    try:
+      streaming.serialize(format, objects, stream,
+                          indent=options.get('indent', None))
+    except Exception, e:
+      if options.get('traceback', False):
+        raise
+      raise CommandError("Unable to serialize database: %s" % e)
+    stream.write("\n")
@@ -0,0 +1,46 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from appengine_django import django_zip_path
+from appengine_django import zipindex
+
+
+class Command(BaseCommand):
+  """Builds the import index for django.zip.
+
+  The index must be rebuilt whenever django.zip is changed, otherwise it is
+  ignored and Django is imported using zipimport. See appengine_django.zipindex
+  for details.
+  """
+  help = 'Builds the import index for django.zip.'
+  args = '[path to zipfile]'
+
+  def handle(self, *args, **options):
+    if len(args) > 1:
+      raise CommandError("Expected at most one zipfile")
+    zip_path = args and args[0] or django_zip_path
+    if not os.path.exists(zip_path):
+      raise CommandError("%s does not exist" % zip_path)
+    index = zipindex.build_index(zip_path)
+    print "Indexed %d modules and %d command directories in %s" % (
+        len(index["modules"]), len(index["commands"]),
+        zipindex.get_index_path(zip_path))
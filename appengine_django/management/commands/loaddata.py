@@ -0,0 +1,52 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from optparse import make_option
+
+from django.core.management.commands import loaddata
+
+from appengine_django import bulkload
+
+
+class Command(loaddata.Command):
+  """Installs fixtures, saving the entities in batches.
+
+  Deserialized objects are buffered and saved with one datastore put per
+  batch, with several puts in flight at once when the SDK supports
+  asynchronous puts.
+  """
+  option_list = loaddata.Command.option_list + (
+      make_option('--batch-size', dest='batch_size', type='int',
+                  default=bulkload.DEFAULT_BATCH_SIZE,
+                  help='Number of entities saved per datastore put.'),
+      make_option('--max-in-flight', dest='max_in_flight', type='int',
+                  default=bulkload.DEFAULT_MAX_IN_FLIGHT,
+                  help='Number of asynchronous puts in progress at once.'),
+  )
+
+  def handle(self, *fixture_labels, **options):
+    bulkload.start(
+        batch_size=options.get('batch_size', bulkload.DEFAULT_BATCH_SIZE),
+        max_in_flight=options.get('max_in_flight',
+                                  bulkload.DEFAULT_MAX_IN_FLIGHT))
+    try:
+      super(Command, self).handle(*fixture_labels, **options)
+    finally:
+      loader = bulkload.finish()
+    if loader.count and int(options.get('verbosity', 1)) > 0:
+      print "Saved %d entities in %d puts (%.0f entities/s)" % (
+          loader.count, loader.puts, loader.rate())
@@ -0,0 +1,65 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from appengine_django import bytecode_snapshot_path
+from appengine_django import snapshot
+
+
+def get_snapshot_modules():
+  """Returns the (name, filename) of the top level modules to snapshot.
+
+  These are the helper, Django, the settings and URLconf modules and the
+  installed apps. Modules loaded from zipfiles are skipped.
+  """
+  names = ["appengine_django", "django",
+           os.environ.get("DJANGO_SETTINGS_MODULE", "settings"),
+           settings.ROOT_URLCONF]
+  names += list(settings.INSTALLED_APPS)
+  modules = []
+  for name in names:
+    name = name.split(".")[0]
+    if name in [m[0] for m in modules]:
+      continue
+    __import__(name)
+    filename = getattr(sys.modules[name], "__file__", None)
+    if filename and os.path.exists(filename):
+      modules.append((name, filename))
+  return modules
+
+
+class Command(BaseCommand):
+  """Compiles the helper, the project and Django into a bytecode snapshot.
+
+  The snapshot must be rebuilt when Python's bytecode format changes, and
+  should be rebuilt after changing any code, although changed modules are
+  always compiled from source. See appengine_django.snapshot for details.
+  """
+  help = 'Compiles the project and Django into a bytecode snapshot.'
+
+  def handle(self, *args, **options):
+    count, size, failed = snapshot.build_snapshot(get_snapshot_modules(),
+                                                  bytecode_snapshot_path)
+    for path in failed:
+      print "Skipped %s, it could not be compiled" % path
+    print "Saved %d modules (%d bytes) to %s" % (count, size,
+                                                 bytecode_snapshot_path)
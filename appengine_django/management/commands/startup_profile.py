@@ -0,0 +1,100 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import subprocess
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import simplejson
+
+
+# Installs the helper in a fresh process and prints the startup profile.
+PROFILE_SCRIPT = """
+import appengine_django
+appengine_django.InstallAppengineHelperForDjango(lazy=%s)
+from django.utils import simplejson
+print simplejson.dumps(appengine_django.startup_profile)
+"""
+
+
+def profile_startup(lazy=False):
+  """Installs the helper in a child process and returns its startup profile.
+
+  See appengine_django.TimePhase for the format of the profile.
+  """
+  child = subprocess.Popen([sys.executable, "-c", PROFILE_SCRIPT % lazy],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           cwd=os.getcwdu())
+  stdout, stderr = child.communicate()
+  if child.returncode != 0:
+    raise CommandError("Helper startup failed:\n%s" % stderr)
+  return simplejson.loads(stdout.strip().splitlines()[-1])
+
+
+def percentile(values, percent):
+  """Returns the given percentile of a list of numbers."""
+  values = sorted(values)
+  index = int(round((len(values) - 1) * percent / 100.0))
+  return values[index]
+
+
+class Command(BaseCommand):
+  """Reports the time taken by each phase of the helper startup.
+
+  The helper is installed the requested number of times, each time in a fresh
+  child process, and the 50th and 90th percentile and maximum wall time of
+  each phase are reported along with the number of modules it imported.
+  """
+  help = 'Reports the time taken by each phase of the helper startup.'
+  option_list = BaseCommand.option_list + (
+      make_option('--runs', dest='runs', type='int', default=10,
+                  help='Number of times to start the helper.'),
+      make_option('--lazy', dest='lazy', action='store_true', default=False,
+                  help='Profile lazy installation of the helper.'),
+  )
+
+  def handle(self, *args, **options):
+    runs = options.get('runs', 10)
+    if runs < 1:
+      raise CommandError("--runs must be at least 1")
+    phases = []
+    timings = {}
+    module_counts = {}
+    for i in range(runs):
+      totals = 0.0
+      for record in profile_startup(options.get('lazy', False)):
+        phase = record["phase"]
+        if phase not in timings:
+          phases.append(phase)
+          timings[phase] = []
+          module_counts[phase] = len(record["modules"])
+        timings[phase].append(record["seconds"])
+        totals += record["seconds"]
+      timings.setdefault("total", []).append(totals)
+    phases.append("total")
+    module_counts["total"] = sum(module_counts.values())
+
+    print "%-36s %9s %9s %9s %8s" % ("phase (ms)", "p50", "p90", "max",
+                                      "modules")
+    for phase in phases:
+      values = timings[phase]
+      print "%-36s %9.1f %9.1f %9.1f %8d" % (
+          phase, percentile(values, 50) * 1000, percentile(values, 90) * 1000,
+          max(values) * 1000, module_counts[phase])
@@ -22,9 +22,23 @@ from google.appengine.ext import db
 from django import VERSION
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.fields import Field
+from django.db.models.fields import FieldDoesNotExist
 from django.db.models.options import Options
 from django.db.models.loading import register_models, get_model
 
+from appengine_django import entitycache
+
+
+# The maximum number of entities in a single datastore get, put or delete.
+MAX_BATCH_SIZE = 500
+
+
+def _chunks(items, batch_size):
+  """Yields successive slices of at most batch_size items."""
+  batch_size = min(batch_size or MAX_BATCH_SIZE, MAX_BATCH_SIZE)
+  for i in range(0, len(items), batch_size):
+    yield items[i:i + batch_size]
+
 
 class ModelManager(object):
   """Replacement for the default Django model manager."""
@@ -36,17 +50,152 @@ class ModelManager(object):
     """Pass all attribute requests through to the real model"""
     return getattr(self.owner, name)
 
+  def _to_key(self, value, key_names=False):
+    if isinstance(value, db.Model):
+      return value.key()
+    if key_names:
+      return db.Key.from_path(self.owner.kind(), value)
+    if isinstance(value, db.Key):
+      return value
+    return db.Key(value)
+
+  def in_bulk(self, id_list, key_names=False, batch_size=None):
+    """Returns a dictionary mapping each id to the entity with that id.
+
+    Ids that have no entity are left out of the dictionary. The entities are
+    fetched with one datastore get per batch_size ids.
+
+    Args:
+      id_list: A list of primary keys (see BaseModel._get_pk_val) or db.Key
+        instances, or of key names if key_names is True.
+    """
+    id_list = list(id_list)
+    keys = [self._to_key(i, key_names) for i in id_list]
+    result = {}
+    offset = 0
+    for batch in _chunks(keys, batch_size):
+      for i, entity in enumerate(db.get(batch)):
+        if entity is not None:
+          result[id_list[offset + i]] = entity
+      offset += len(batch)
+    return result
+
+  def bulk_create(self, objs, batch_size=None):
+    """Saves the entities with one datastore put per batch_size entities.
+
+    Returns:
+      The keys of the saved entities.
+    """
+    keys = []
+    for batch in _chunks(list(objs), batch_size):
+      keys.extend(db.put(batch))
+    if self.owner.cache_entities:
+      entitycache.invalidate(keys)
+    return keys
+
+  def bulk_delete(self, keys, key_names=False, batch_size=None):
+    """Deletes entities with one datastore delete per batch_size entities.
+
+    Args:
+      keys: A list of entities, primary keys or db.Key instances, or of key
+        names if key_names is True.
+    """
+    keys = [self._to_key(k, key_names) for k in keys]
+    for batch in _chunks(keys, batch_size):
+      db.delete(batch)
+    if self.owner.cache_entities:
+      entitycache.invalidate(keys)
+
+  def get_query_set(self):
+    """Returns a QuerySet for all entities of the model."""
+    from appengine_django.query import QuerySet
+    return QuerySet(self.owner)
+
+  def all(self):
+    """Returns a db.Query for all entities of the model, as Model.all does.
+
+    Use get_query_set for a Django style QuerySet.
+    """
+    return self.owner.all()
+
+  def filter(self, *args, **kwargs):
+    return self.get_query_set().filter(*args, **kwargs)
+
+  def exclude(self, **kwargs):
+    return self.get_query_set().exclude(**kwargs)
+
+  def order_by(self, *fields):
+    return self.get_query_set().order_by(*fields)
+
+  def count(self, limit=None):
+    return self.get_query_set().count(limit)
+
+  def keys(self):
+    return self.get_query_set().keys()
+
+  def values(self, *fields):
+    return self.get_query_set().values(*fields)
+
+  def values_list(self, *fields, **kwargs):
+    return self.get_query_set().values_list(*fields, **kwargs)
+
+  def get(self, *args, **kwargs):
+    """Returns the entity matching the lookups, as QuerySet.get does.
+
+    For compatibility with Model.get, keys may be given instead. Without any
+    arguments the first entity, or None, is returned as db.Query.get does.
+    """
+    if args:
+      return self.owner.get(*args, **kwargs)
+    if not kwargs:
+      return self.owner.all().get()
+    return self.get_query_set().get(**kwargs)
+
   # Django 1.2.1 compat
   def using(self, alias):
     return self.owner
 
+# The kinds of field recorded in ModelOptions.field_kinds. Serializers use
+# these to decide how to convert values without checking the property types.
+FIELD_OTHER = 0
+FIELD_REFERENCE = 1
+FIELD_DATE = 2
+FIELD_TIME = 3
+FIELD_DATETIME = 4
+
+
+def field_kind(prop):
+  """Returns the kind of field (eg. FIELD_DATE) for a property."""
+  if isinstance(prop, db.Reference):
+    return FIELD_REFERENCE
+  # Date and time properties are subclasses of DateTimeProperty.
+  if isinstance(prop, db.DateProperty):
+    return FIELD_DATE
+  if isinstance(prop, db.TimeProperty):
+    return FIELD_TIME
+  if isinstance(prop, db.DateTimeProperty):
+    return FIELD_DATETIME
+  return FIELD_OTHER
+
+
 class ModelOptions(object):
   """Replacement for the default Django options class.
 
   This class sits at ._meta of each model. The primary information supplied by
   this class that needs to be stubbed out is the list of fields on the model.
+
+  The following metadata is computed once when the model class is created:
+    field_map: Maps the attribute name of each property to its field.
+    field_kinds: Maps the attribute name of each property to its kind of field
+      (eg. FIELD_REFERENCE).
+    value_getters: Maps the attribute name of each property to a function
+      returning the datastore value of the property for an instance.
   """
 
+  field_map = {}
+  field_kinds = {}
+  value_getters = {}
+
   # Django 1.1 compat
   proxy = None
   # Django 1.2.1 compat
@@ -66,6 +215,25 @@ class ModelOptions(object):
   def __str__(self):
     return "%s.%s" % (self.app_label, self.module_name)
 
+  def set_fields(self, properties):
+    """Sets the fields and field metadata from a dictionary of properties."""
+    self.field_map = {}
+    self.field_kinds = {}
+    self.value_getters = {}
+    for name, prop in properties.iteritems():
+      self.field_map[name] = PropertyWrapper(prop)
+      self.field_kinds[name] = field_kind(prop)
+      self.value_getters[name] = prop.get_value_for_datastore
+    self.local_fields = self.fields = self.field_map.values()
+
+  def get_field(self, name):
+    """Returns the field for the named property, as Django's Options does."""
+    try:
+      return self.field_map[name]
+    except KeyError:
+      raise FieldDoesNotExist("%s has no field named %r" %
+                              (self.object_name, name))
+
   @property
   def many_to_many(self):
     """The datastore does not support many to many relationships."""
@@ -78,7 +246,14 @@ class Relation(object):
 
 
 def PropertyWrapper(prop):
-  """Wrapper for db.Property to make it look like a Django model Property"""
+  """Wrapper for db.Property to make it look like a Django model Property
+
+  Properties inherited from a parent model are shared with it, so a property
+  is only wrapped the first time.
+  """
+  if getattr(prop, "_django_wrapped", False):
+    return prop
+  prop._django_wrapped = True
   if isinstance(prop, db.Reference):
     prop.rel = Relation(prop.reference_class)
   else:
@@ -162,9 +337,7 @@ class PropertiedClassWithDjango(db.PropertiedClass):
       # This metaclass only acts on subclasses of BaseModel.
       return
 
-    fields = [PropertyWrapper(p) for p in cls._properties.values()]
-    cls._meta.local_fields = fields
-    cls._meta.fields = fields
+    cls._meta.set_fields(cls._properties)
 
 
 class BaseModel(db.Model):
@@ -177,17 +350,110 @@ class BaseModel(db.Model):
   # Required for Django 1.1.2 and 1.2.1
   _deferred = False
 
+  # Set to True in a subclass to cache its entities, see entitycache.py.
+  cache_entities = False
+
+  @classmethod
+  def get(cls, keys, **kwargs):
+    """Returns the entities for keys, from the cache if it is enabled."""
+    if not cls.cache_entities or kwargs:
+      return super(BaseModel, cls).get(keys, **kwargs)
+    multiple = isinstance(keys, (list, tuple))
+    if not multiple:
+      keys = [keys]
+    keys = [isinstance(k, basestring) and db.Key(k) or k for k in keys]
+    entities = entitycache.get(keys)
+    for entity in entities:
+      if entity is not None and not isinstance(entity, cls):
+        raise db.KindError("Kind %r is not a subclass of kind %r" %
+                           (entity.kind(), cls.kind()))
+    if multiple:
+      return entities
+    return entities[0]
+
+  @classmethod
+  def get_by_key_name(cls, key_names, parent=None, **kwargs):
+    """Returns the entities for key_names, as get() does."""
+    if not cls.cache_entities or kwargs:
+      return super(BaseModel, cls).get_by_key_name(key_names, parent=parent,
+                                                   **kwargs)
+    if isinstance(parent, db.Model):
+      parent = parent.key()
+    if isinstance(key_names, (list, tuple)):
+      return cls.get([db.Key.from_path(cls.kind(), name, parent=parent)
+                      for name in key_names])
+    return cls.get(db.Key.from_path(cls.kind(), key_names, parent=parent))
+
+  def put(self, **kwargs):
+    key = super(BaseModel, self).put(**kwargs)
+    self._django_key_cache = None
+    if self.cache_entities:
+      entitycache.invalidate([key])
+    return key
+
+  def delete(self, **kwargs):
+    key = self.key()
+    super(BaseModel, self).delete(**kwargs)
+    if self.cache_entities:
+      entitycache.invalidate([key])
+
+  # The entity's key along with values derived from it, see _key_cache.
+  _django_key_cache = None
+
+  def _key_cache(self):
+    """Returns a list of [key, path, string] for the entity's key.
+
+    The path and string are computed when first needed and are kept until the
+    entity's key changes, eg. when an entity with an incomplete key is saved.
+
+    Raises:
+      db.NotSavedError if the entity has no key yet.
+    """
+    key = self.key()
+    cache = self._django_key_cache
+    if cache is None or cache[0] is not key:
+      cache = self._django_key_cache = [key, None, None]
+    return cache
+
+  def _get_key_path(self):
+    """Returns a tuple identifying the entity's key, or None if it has none."""
+    try:
+      cache = self._key_cache()
+    except db.NotSavedError:
+      return None
+    if cache[1] is None:
+      key = cache[0]
+      namespace = getattr(key, "namespace", lambda: None)()
+      cache[1] = (key.app(), namespace) + tuple(key.to_path())
+    return cache[1]
+
   def __eq__(self, other):
     if not isinstance(other, self.__class__):
       return False
-    return self._get_pk_val() == other._get_pk_val()
+    path = self._get_key_path()
+    if path is None:
+      return self is other
+    return path == other._get_key_path()
 
   def __ne__(self, other):
     return not self.__eq__(other)
 
+  def __hash__(self):
+    """Hashes the entity's key, or the instance if it has no key yet.
+
+    The hash of an entity without a key_name changes when it is first saved.
+    """
+    path = self._get_key_path()
+    if path is None:
+      return id(self)
+    return hash(path)
+
   def _get_pk_val(self):
     """Return the string representation of the model's key"""
-    return unicode(self.key())
+    cache = self._key_cache()
+    if cache[2] is None:
+      cache[2] = unicode(cache[0])
+    return cache[2]
 
   def __repr__(self):
     """Create a string that can be used to construct an equivalent object.
@@ -196,11 +462,9 @@ class BaseModel(db.Model):
     """
     # First, creates a dictionary of property names and values. Note that
     # property values, not property objects, has to be passed in to constructor.
-    def _MakeReprTuple(prop_name):
-      prop = getattr(self.__class__, prop_name)
-      return (prop_name, prop.get_value_for_datastore(self))
-
-    d = dict([_MakeReprTuple(prop_name) for prop_name in self.properties()])
+    d = {}
+    for prop_name, get_value in self._meta.value_getters.iteritems():
+      d[prop_name] = get_value(self)
     return "%s(**%s)" % (self.__class__.__name__, repr(d))
 
 
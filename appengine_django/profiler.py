@@ -0,0 +1,195 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-request accounting of the App Engine API calls made by a view.
+
+Hooks installed into the apiproxy count, size and time every API call (eg.
+datastore, memcache and mail RPCs) made while a profile is active. To profile
+every request add the middleware to settings.py:
+
+  MIDDLEWARE_CLASSES = (
+      'appengine_django.profiler.RPCProfileMiddleware',
+      ...
+  )
+
+The middleware is configured with the following settings:
+
+  RPC_PROFILE_HEADER - If True, the summary is added to each response as an
+      X-AppEngine-RPC-Profile header. Defaults to DEBUG.
+  RPC_PROFILE_LOG - If True, the summary is logged for each request. Defaults
+      to False.
+  RPC_BUDGET - The maximum number of API calls a request may make. Either an
+      integer limiting the total, or a dictionary mapping service names (eg.
+      'datastore_v3') to a limit for that service.
+  RPC_BUDGET_STRICT - If True, requests that exceed RPC_BUDGET raise
+      RPCBudgetExceeded, failing any test that made the request. Otherwise a
+      warning is logged. Defaults to False.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from google.appengine.api import apiproxy_stub_map
+
+
+HOOK_NAME = "appengine_django.profiler"
+
+HEADER_NAME = "X-AppEngine-RPC-Profile"
+
+
+class RPCBudgetExceeded(Exception):
+  """Raised when a request makes more API calls than RPC_BUDGET allows."""
+  pass
+
+
+class RPCProfile(object):
+  """Records the API calls made while the profile is active.
+
+  Calls are recorded per (service, method) in the calls dictionary as a list
+  of [count, request_bytes, response_bytes, seconds].
+  """
+
+  def __init__(self):
+    self.calls = {}
+    self._started = {}
+
+  def start_call(self, service, method, request):
+    self._started[id(request)] = time.time()
+    stats = self.calls.setdefault((service, method), [0, 0, 0, 0.0])
+    stats[0] += 1
+    stats[1] += _byte_size(request)
+
+  def end_call(self, service, method, request, response):
+    start = self._started.pop(id(request), None)
+    stats = self.calls.setdefault((service, method), [0, 0, 0, 0.0])
+    stats[2] += _byte_size(response)
+    if start is not None:
+      stats[3] += time.time() - start
+
+  def count(self, service=None):
+    """Returns the number of calls made, optionally to a single service."""
+    total = 0
+    for (call_service, unused_method), stats in self.calls.iteritems():
+      if service is None or service == call_service:
+        total += stats[0]
+    return total
+
+  def summary(self):
+    """Returns a one line summary of the calls made, by service and method.
+
+    Each call is summarised as service.method=count/bytes/milliseconds where
+    bytes is the total size of the requests and responses.
+    """
+    parts = []
+    for (service, method), stats in sorted(self.calls.items()):
+      parts.append("%s.%s=%d/%d/%.1f" % (service, method, stats[0],
+                                         stats[1] + stats[2],
+                                         stats[3] * 1000))
+    return " ".join(parts)
+
+  def check_budget(self, budget):
+    """Returns a list of the (service, count, limit) tuples over budget.
+
+    Args:
+      budget: Either an integer limiting the total number of calls or a
+        dictionary mapping service names to limits. None means no limit.
+    """
+    if budget is None:
+      return []
+    if isinstance(budget, dict):
+      limits = budget.items()
+    else:
+      limits = [(None, budget)]
+    exceeded = []
+    for service, limit in limits:
+      count = self.count(service)
+      if count > limit:
+        exceeded.append((service or "all", count, limit))
+    return exceeded
+
+
+_local = threading.local()
+
+
+def _byte_size(message):
+  try:
+    return message.ByteSize()
+  except AttributeError:
+    return 0
+
+
+def start_profile():
+  """Starts and returns a new profile for the current thread."""
+  _local.profile = RPCProfile()
+  return _local.profile
+
+
+def stop_profile():
+  """Stops and returns the active profile for the current thread."""
+  profile = getattr(_local, "profile", None)
+  _local.profile = None
+  return profile
+
+
+def _pre_call_hook(service, call, request, response):
+  profile = getattr(_local, "profile", None)
+  if profile is not None:
+    profile.start_call(service, call, request)
+
+
+def _post_call_hook(service, call, request, response):
+  profile = getattr(_local, "profile", None)
+  if profile is not None:
+    profile.end_call(service, call, request, response)
+
+
+def install_hooks():
+  """Installs the profiling hooks into the current apiproxy.
+
+  This must be called again whenever the apiproxy is replaced, for example
+  when the development stubs are set up.
+  """
+  apiproxy = apiproxy_stub_map.apiproxy
+  apiproxy.GetPreCallHooks().Append(HOOK_NAME, _pre_call_hook)
+  apiproxy.GetPostCallHooks().Append(HOOK_NAME, _post_call_hook)
+
+
+class RPCProfileMiddleware(object):
+  """Profiles the API calls made by each request."""
+
+  def process_request(self, request):
+    start_profile()
+
+  def process_response(self, request, response):
+    profile = stop_profile()
+    if profile is None:
+      return response
+    summary = profile.summary()
+    if getattr(settings, "RPC_PROFILE_HEADER", settings.DEBUG):
+      response[HEADER_NAME] = summary
+    if getattr(settings, "RPC_PROFILE_LOG", False):
+      logging.info("RPC profile for %s: %s" % (request.path, summary))
+    exceeded = profile.check_budget(getattr(settings, "RPC_BUDGET", None))
+    if exceeded:
+      message = "%s exceeded the RPC budget: %s" % (request.path, ", ".join(
+          ["%s %d > %d" % e for e in exceeded]))
+      if getattr(settings, "RPC_BUDGET_STRICT", False):
+        raise RPCBudgetExceeded(message)
+      logging.warning(message)
+    return response
@@ -0,0 +1,362 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A lazy, Django style QuerySet for datastore queries.
+
+The QuerySet is returned by the get_query_set, filter, exclude and order_by
+methods of the model manager, eg.
+
+  Model.objects.filter(name="x", count__gte=2).order_by("-date")[:10]
+
+Filters use Django's field__lookup syntax, with the exact, gt, gte, lt, lte
+and in lookups supported. The pk field refers to the entity's key. The
+datastore restrictions on queries apply, eg. inequality filters may only be
+used on a single property.
+
+Nothing is fetched until the QuerySet is iterated, indexed or counted.
+Iteration fetches the results in batches using query cursors and does not
+keep them, so arbitrarily large queries can be iterated in bounded memory.
+
+When only keys or a few properties are needed, keys(), values() and
+values_list() return them without creating model instances.
+"""
+
+import operator
+
+from django.core.exceptions import MultipleObjectsReturned
+
+
+# The number of entities fetched by each datastore query made while iterating.
+DEFAULT_BATCH_SIZE = 100
+
+LOOKUP_OPERATORS = {
+    "exact": "=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "in": "IN",
+}
+
+
+def _property_name(name):
+  if name == "pk":
+    return "__key__"
+  return name
+
+
+def _parse_lookup(lookup):
+  """Returns the (property, operator) for a Django style lookup."""
+  parts = lookup.split("__")
+  if len(parts) > 1 and parts[-1] in LOOKUP_OPERATORS:
+    return _property_name("__".join(parts[:-1])), LOOKUP_OPERATORS[parts[-1]]
+  return _property_name(lookup), "="
+
+
+class QuerySet(object):
+  """A lazily evaluated datastore query for a model."""
+
+  def __init__(self, model):
+    self.model = model
+    self._filters = []
+    self._ordering = []
+    self._low = 0
+    self._high = None
+    self._batch_size = DEFAULT_BATCH_SIZE
+
+  def _clone(self):
+    clone = self.__class__.__new__(self.__class__)
+    clone.__dict__.update(self.__dict__)
+    clone._filters = list(self._filters)
+    clone._ordering = list(self._ordering)
+    return clone
+
+  def _get_query(self, keys_only=False):
+    """Returns a db.Query for the filters and ordering, ignoring slicing."""
+    query = self.model.all(keys_only=keys_only)
+    for property_operator, value in self._filters:
+      query.filter(property_operator, value)
+    for order in self._ordering:
+      query.order(order)
+    return query
+
+  def _uses_cursors(self):
+    # Queries with IN and != filters are run as several queries, which do not
+    # support cursors.
+    for property_operator, value in self._filters:
+      if property_operator.upper().endswith((" IN", "!=")):
+        return False
+    return True
+
+  def __repr__(self):
+    return "<%s for %s filters=%r ordering=%r>" % (
+        self.__class__.__name__, self.model.kind(), self._filters,
+        self._ordering)
+
+  def all(self):
+    return self._clone()
+
+  def filter(self, *args, **kwargs):
+    """Returns a new QuerySet restricted by the given lookups.
+
+    For compatibility with db.Query a property and operator string and a
+    value may also be given, eg. filter("count >", 2).
+    """
+    if args and len(args) != 2:
+      raise TypeError("filter() takes a property and operator string and a "
+                      "value, %d positional arguments given" % len(args))
+    clone = self._clone()
+    if args:
+      property_operator, value = args
+      clone._filters.append((property_operator, value))
+    for lookup, value in kwargs.items():
+      name, operator = _parse_lookup(lookup)
+      clone._filters.append(("%s %s" % (name, operator), value))
+    return clone
+
+  def exclude(self, **kwargs):
+    """Returns a new QuerySet excluding entities matching the lookup.
+
+    Only a single exact or in lookup is supported per call, which is
+    translated to one or more != filters.
+    """
+    if len(kwargs) != 1:
+      raise NotImplementedError("exclude() only supports one lookup per call")
+    lookup, value = kwargs.items()[0]
+    name, operator = _parse_lookup(lookup)
+    if operator == "=":
+      values = [value]
+    elif operator == "IN":
+      values = value
+    else:
+      raise NotImplementedError("exclude() does not support %s" % lookup)
+    clone = self._clone()
+    for value in values:
+      clone._filters.append(("%s !=" % name, value))
+    return clone
+
+  def order_by(self, *fields):
+    """Returns a new QuerySet with the given ordering replacing any other."""
+    clone = self._clone()
+    clone._ordering = []
+    for field in fields:
+      if field.startswith("-"):
+        clone._ordering.append("-" + _property_name(field[1:]))
+      else:
+        clone._ordering.append(_property_name(field))
+    return clone
+
+  def with_batch_size(self, batch_size):
+    """Returns a new QuerySet that fetches batch_size entities per query."""
+    clone = self._clone()
+    clone._batch_size = batch_size
+    return clone
+
+  def __getitem__(self, k):
+    if isinstance(k, slice):
+      assert ((k.start is None or k.start >= 0) and
+              (k.stop is None or k.stop >= 0)), \
+          "Negative indexing is not supported."
+      assert k.step is None, "Slicing with a step is not supported."
+      clone = self._clone()
+      if k.start is not None:
+        clone._low = self._low + k.start
+      if k.stop is not None:
+        clone._high = self._low + k.stop
+        if self._high is not None:
+          clone._high = min(clone._high, self._high)
+      if clone._high is not None:
+        clone._high = max(clone._high, clone._low)
+      return clone
+    assert k >= 0, "Negative indexing is not supported."
+    results = list(self[k:k + 1])
+    if not results:
+      raise IndexError("QuerySet index out of range")
+    return results[0]
+
+  def batches(self, keys_only=False, raw=False):
+    """Yields lists of results, fetching each using a query cursor.
+
+    Queries that cannot use cursors fetch each batch using an offset. If raw
+    is True the results are datastore.Entity instances rather than models.
+    """
+    query = self._get_query(keys_only)
+    remaining = None
+    if self._high is not None:
+      remaining = self._high - self._low
+    offset = self._low
+    use_cursors = self._uses_cursors()
+    while remaining is None or remaining > 0:
+      limit = self._batch_size
+      if remaining is not None:
+        limit = min(limit, remaining)
+      if raw:
+        raw_query = query._get_query()
+        results = raw_query.Get(limit, offset)
+        # query.cursor() returns the cursor of the last query it ran.
+        query._last_raw_query = raw_query
+      else:
+        results = query.fetch(limit, offset)
+      if results:
+        yield results
+      if len(results) < limit:
+        return
+      if remaining is not None:
+        remaining -= len(results)
+      if use_cursors:
+        offset = 0
+        query.with_cursor(query.cursor())
+      else:
+        offset += len(results)
+
+  def iterator(self, keys_only=False):
+    """Yields the results, fetching them in batches."""
+    for batch in self.batches(keys_only):
+      for result in batch:
+        yield result
+
+  def keys(self):
+    """Returns the keys of the results, fetched using keys only queries."""
+    return self.iterator(keys_only=True)
+
+  def values(self, *fields):
+    """Returns a QuerySet that yields a dictionary of fields per entity.
+
+    See ValuesQuerySet for details.
+    """
+    return self._values(ValuesQuerySet, fields, dict)
+
+  def values_list(self, *fields, **kwargs):
+    """Returns a QuerySet that yields a lightweight row per entity.
+
+    Each row is a tuple that also allows its fields to be read as attributes.
+    If flat is True and there is a single field, its values are returned
+    instead. See ValuesQuerySet for details.
+    """
+    if kwargs.get("flat"):
+      if len(fields) != 1:
+        raise TypeError("flat is only valid with a single field")
+      return self._values(ValuesQuerySet, fields, lambda row: row[0])
+    return self._values(ValuesQuerySet, fields, None)
+
+  def _values(self, klass, fields, make_row):
+    clone = klass.__new__(klass)
+    clone.__dict__.update(self._clone().__dict__)
+    if not fields:
+      fields = ["pk"] + sorted(self.model.properties())
+    clone._fields = tuple(fields)
+    if make_row is dict:
+      make_row = lambda row: dict(zip(fields, row))
+    elif make_row is None:
+      make_row = row_class(clone._fields)
+    clone._make_row = make_row
+    return clone
+
+  def __iter__(self):
+    return self.iterator()
+
+  def __nonzero__(self):
+    for batch in self[:1].batches(keys_only=True):
+      return True
+    return False
+
+  def count(self, limit=None):
+    """Returns the number of results, counting at most limit entities.
+
+    The count is made with a keys only query.
+    """
+    if self._high is not None:
+      limit = min(limit or self._high - self._low, self._high - self._low)
+    if limit is None:
+      total = self._get_query(keys_only=True).count()
+    else:
+      total = self._get_query(keys_only=True).count(self._low + limit)
+    return max(0, total - self._low)
+
+  def fetch(self, limit, offset=0):
+    """Returns a list of results, for compatibility with db.Query."""
+    return list(self[offset:offset + limit])
+
+  def get(self, **kwargs):
+    """Returns the single entity matching the lookups.
+
+    Raises:
+      DoesNotExist if there is no matching entity.
+      MultipleObjectsReturned if there is more than one.
+    """
+    results = list(self.filter(**kwargs)[:2])
+    if not results:
+      raise self.model.DoesNotExist("%s matching query does not exist." %
+                                    self.model.__name__)
+    if len(results) > 1:
+      raise MultipleObjectsReturned("get() returned more than one %s." %
+                                    self.model.__name__)
+    return results[0]
+
+
+_row_classes = {}
+
+
+def row_class(fields):
+  """Returns a tuple subclass whose items can be read as the given fields."""
+  cls = _row_classes.get(fields)
+  if cls is None:
+    attrs = {"__slots__": (), "_fields": fields}
+    for i, field in enumerate(fields):
+      attrs[field] = property(operator.itemgetter(i))
+    cls = _row_classes[fields] = type("Row", (tuple,), attrs)
+  return cls
+
+
+class ValuesQuerySet(QuerySet):
+  """A QuerySet that yields the values of some fields instead of entities.
+
+  Model instances are never created. If only the pk or key_name fields are
+  requested the results are fetched with a keys only query, otherwise they
+  are fetched as raw datastore entities. Values are returned as stored in the
+  datastore, so for example references are returned as keys.
+  """
+
+  def iterator(self, keys_only=False):
+    if keys_only:
+      for key in super(ValuesQuerySet, self).iterator(keys_only=True):
+        yield key
+      return
+    key_fields = {"pk": lambda key: key, "key_name": lambda key: key.name()}
+    getters = []
+    properties = self.model.properties()
+    for field in self._fields:
+      if field not in key_fields:
+        # Properties may be stored under a different name to the attribute.
+        getters.append((None, properties[field].name))
+      else:
+        getters.append((key_fields[field], None))
+    make_row = self._make_row
+    if not [name for key_field, name in getters if name]:
+      for keys in self.batches(keys_only=True):
+        for key in keys:
+          yield make_row([key_field(key) for key_field, name in getters])
+      return
+    for entities in self.batches(raw=True):
+      for entity in entities:
+        key = entity.key()
+        row = []
+        for key_field, name in getters:
+          if key_field:
+            row.append(key_field(key))
+          else:
+            row.append(entity.get(name))
+        yield make_row(row)
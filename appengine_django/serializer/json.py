@@ -35,13 +35,13 @@ class DjangoJSONEncoder(simplejson.JSONEncoder):
         if isinstance(o, datetime.datetime):
             d = datetime_safe.new_datetime(o)
             output = d.strftime("%s %s" % (self.DATE_FORMAT, self.TIME_FORMAT))
-            return "%s.%s" % (output, d.microsecond)
+            return "%s.%06d" % (output, d.microsecond)
         elif isinstance(o, datetime.date):
             d = datetime_safe.new_date(o)
             return d.strftime(self.DATE_FORMAT)
         elif isinstance(o, datetime.time):
             output = o.strftime(self.TIME_FORMAT)
-            return "%s.%s" % (output, o.microsecond)
+            return "%s.%06d" % (output, o.microsecond)
         elif isinstance(o, decimal.Decimal):
             return str(o)
         else:
@@ -34,6 +34,11 @@ from google.appengine.ext import db
 
 from django.utils.encoding import smart_unicode
 
+from appengine_django.models import FIELD_DATE
+from appengine_django.models import FIELD_DATETIME
+from appengine_django.models import FIELD_REFERENCE
+from appengine_django.models import FIELD_TIME
+
 Serializer = python.Serializer
 
 
@@ -55,9 +60,14 @@ def Deserializer(object_list, **options):
   stream or a string) to the constructor
   """
   models.get_apps()
+  encoding = options.get("encoding", settings.DEFAULT_CHARSET)
+  model_cache = {}
   for d in object_list:
     # Look up the model and starting build a dict of data for it.
-    Model = python._get_model(d["model"])
+    Model = model_cache.get(d["model"])
+    if Model is None:
+      Model = model_cache[d["model"]] = python._get_model(d["model"])
+    converters = get_converters(Model)
     data = {}
     key = resolve_key(Model._meta.module_name, d["pk"])
     if key.name():
@@ -70,33 +80,9 @@ def Deserializer(object_list, **options):
     # Handle each field
     for (field_name, field_value) in d["fields"].iteritems():
       if isinstance(field_value, str):
-        field_value = smart_unicode(
-            field_value, options.get("encoding",
-                                     settings.DEFAULT_CHARSET),
-            strings_only=True)
-      field = Model.properties()[field_name]
-
-      if isinstance(field, db.Reference):
-        # Resolve foreign key references.
-        data[field.name] = resolve_key(Model._meta.module_name, field_value)
-      else:
-        # Handle converting strings to more specific formats.
-        if isinstance(field_value, basestring):
-          if isinstance(field, db.DateProperty):
-            field_value = datetime.datetime.strptime(
-                field_value, '%Y-%m-%d').date()
-          elif isinstance(field, db.TimeProperty):
-            field_value = parse_datetime_with_microseconds(field_value,
-                                                           '%H:%M:%S').time()
-          elif isinstance(field, db.DateTimeProperty):
-            field_value = parse_datetime_with_microseconds(field_value,
-                                                           '%Y-%m-%d %H:%M:%S')
-        # Handle pyyaml datetime.time deserialization - it returns a datetime
-        # instead of a time.
-        if (isinstance(field_value, datetime.datetime) and
-            isinstance(field, db.TimeProperty)):
-          field_value = field_value.time()
-        data[field.name] = field.validate(field_value)
+        field_value = smart_unicode(field_value, encoding, strings_only=True)
+      name, convert = converters[field_name]
+      data[name] = convert(field_value)
     # Create the new model instance with all it's data, but no parent.
     object = Model(**data)
     # Now add the parent into the hidden attribute, bypassing the type checks
@@ -108,6 +94,122 @@ def Deserializer(object_list, **options):
     yield base.DeserializedObject(object, m2m_data)
 
 
+# Converters for each model class, see get_converters.
+_converters = {}
+
+
+def get_converters(Model):
+  """Returns the functions that convert serialized field values for a model.
+
+  The converters are created once for each model class.
+
+  Returns:
+    A dictionary mapping each field name to an (attribute name, converter)
+    tuple. The converter takes the serialized value of the field and returns
+    the validated value to pass to the model's constructor.
+  """
+  converters = _converters.get(Model)
+  if converters is None:
+    converters = {}
+    for field_name, field in Model._meta.field_map.iteritems():
+      kind = Model._meta.field_kinds[field_name]
+      converters[field_name] = (field.name,
+                                _make_converter(Model, field, kind))
+    _converters[Model] = converters
+  return converters
+
+
+def _make_converter(Model, field, kind):
+  validate = field.validate
+  if kind == FIELD_REFERENCE:
+    module_name = Model._meta.module_name
+    # Resolve foreign key references.
+    return lambda value: resolve_key(module_name, value)
+  if kind == FIELD_DATE:
+    def convert_date(value):
+      if isinstance(value, basestring):
+        value = parse_date(value)
+      return validate(value)
+    return convert_date
+  if kind == FIELD_TIME:
+    def convert_time(value):
+      if isinstance(value, basestring):
+        value = parse_time(value)
+      elif isinstance(value, datetime.datetime):
+        # Handle pyyaml datetime.time deserialization - it returns a datetime
+        # instead of a time.
+        value = value.time()
+      return validate(value)
+    return convert_time
+  if kind == FIELD_DATETIME:
+    def convert_datetime(value):
+      if isinstance(value, basestring):
+        value = parse_datetime(value)
+      return validate(value)
+    return convert_datetime
+  return validate
+
+
+def _parse_time_fields(value):
+  """Returns (hour, minute, second, microsecond) for "HH:MM:SS[.ffffff]".
+
+  The digits after the point are a count of microseconds, as written by
+  earlier versions of the JSON encoder which did not zero pad them.
+
+  Returns None if the value is not in that format.
+  """
+  if len(value) < 8 or value[2] != ":" or value[5] != ":":
+    return None
+  if not (value[:2] + value[3:5] + value[6:8]).isdigit():
+    return None
+  if len(value) == 8:
+    return int(value[:2]), int(value[3:5]), int(value[6:8]), 0
+  fraction = value[9:]
+  if value[8] != "." or len(fraction) > 6 or not fraction.isdigit():
+    return None
+  return int(value[:2]), int(value[3:5]), int(value[6:8]), int(fraction)
+
+
+def _parse_date_fields(value):
+  """Returns (year, month, day) for a value starting "YYYY-MM-DD" or None."""
+  if len(value) < 10 or value[4] != "-" or value[7] != "-":
+    return None
+  if not (value[:4] + value[5:7] + value[8:10]).isdigit():
+    return None
+  return int(value[:4]), int(value[5:7]), int(value[8:10])
+
+
+def parse_date(value):
+  """Parses a "YYYY-MM-DD" string to a date."""
+  fields = len(value) == 10 and _parse_date_fields(value)
+  if not fields:
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+  return datetime.date(*fields)
+
+
+def parse_time(value):
+  """Parses a "HH:MM:SS" string, with optional microseconds, to a time."""
+  fields = _parse_time_fields(value)
+  if fields is None:
+    return parse_datetime_with_microseconds(value, "%H:%M:%S").time()
+  return datetime.time(*fields)
+
+
+def parse_datetime(value):
+  """Parses a "YYYY-MM-DD HH:MM:SS" string, with optional microseconds.
+
+  Values in this format are parsed directly. Other values are parsed with
+  parse_datetime_with_microseconds, which raises a ValueError if the value
+  cannot be parsed.
+  """
+  date_fields = len(value) > 10 and value[10] == " " and _parse_date_fields(
+      value)
+  time_fields = date_fields and _parse_time_fields(value[11:])
+  if not time_fields:
+    return parse_datetime_with_microseconds(value, "%Y-%m-%d %H:%M:%S")
+  return datetime.datetime(*(date_fields + time_fields))
+
+
 def parse_datetime_with_microseconds(field_value, format):
   """Parses a string to a datetime object including microseconds.
 
@@ -118,6 +220,10 @@ def parse_datetime_with_microseconds(field_value, format):
 
   Returns:
     A datetime instance.
+
+  Raises:
+    ValueError if the value cannot be parsed or has more than six digits of
+    microseconds.
   """
   try:
     # This will only return if no microseconds were availanle.
@@ -129,20 +235,162 @@ def parse_datetime_with_microseconds(field_value, format):
     if not match:
       raise
     ms_str = match.group(1)
+    if len(ms_str) > 6:
+      raise ValueError("More than six digits of microseconds in %r" %
+                       field_value)
     without_ms = field_value[:-(len(ms_str)+1)]
     new_value = datetime.datetime.strptime(without_ms, format)
     return new_value.replace(microsecond=int(ms_str))
 
 
+# The maximum number of resolved keys kept by resolve_key.
+KEY_CACHE_SIZE = 1000
+
+
+class LRUCache(object):
+  """A dictionary like cache that keeps the most recently used max_size items.
+
+  Items are kept in a circular doubly linked list in order of use, each link
+  being a [previous, next, key, value] list.
+  """
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self.clear()
+
+  def clear(self):
+    self._links = {}
+    self._root = root = []
+    root[:] = [root, root, None, None]
+
+  def __len__(self):
+    return len(self._links)
+
+  def get(self, key, default=None):
+    link = self._links.get(key)
+    if link is None:
+      return default
+    # Move the link to the most recently used end of the list.
+    link_prev, link_next = link[0], link[1]
+    link_prev[1] = link_next
+    link_next[0] = link_prev
+    root = self._root
+    last = root[0]
+    last[1] = root[0] = link
+    link[0], link[1] = last, root
+    return link[3]
+
+  def set(self, key, value):
+    link = self._links.get(key)
+    if link is not None:
+      self.get(key)
+      link[3] = value
+      return
+    root = self._root
+    if len(self._links) >= self.max_size:
+      # Discard the least recently used item.
+      oldest = root[1]
+      root[1] = oldest[1]
+      oldest[1][0] = root
+      del self._links[oldest[2]]
+    last = root[0]
+    link = [last, root, key, value]
+    last[1] = root[0] = self._links[key] = link
+
+
+_key_cache = LRUCache(KEY_CACHE_SIZE)
+
+# Matches the repr() of a key, eg.
+#   datastore_types.Key.from_path(u'Model', u'name', _app=u'app')
+_KEY_REPR_RE = re.compile(r"\s*(?:[A-Za-z_]\w*\.)*Key\.from_path\((.*)\)\s*$",
+                          re.DOTALL)
+
+# Matches one argument of a key's repr, as a string, an integer or None,
+# optionally given as a keyword argument.
+_KEY_REPR_ARG_RE = re.compile(r"""
+    \s*(?:(?P<keyword>[A-Za-z_]\w*)\s*=\s*)?
+    (?:(?P<unicode>[uU]?)(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      |(?P<number>-?\d+)[lL]?
+      |(?P<none>None))
+    \s*(?:,|$)""", re.VERBOSE | re.DOTALL)
+
+# The keyword arguments of db.Key.from_path that may appear in a key's repr.
+_KEY_REPR_KEYWORDS = ("_app", "namespace")
+
+# Characters that may appear in the str() of a key.
+_ENCODED_KEY_RE = re.compile(r"[A-Za-z0-9_=-]+$")
+
+
+def _parse_string_literal(is_unicode, literal):
+  """Returns the value of a quoted string literal as eval would."""
+  body = literal[1:-1]
+  if is_unicode:
+    if not isinstance(body, unicode):
+      body = body.decode("utf-8")
+    if "\\" in body:
+      body = body.encode("raw_unicode_escape").decode("unicode_escape")
+  else:
+    if isinstance(body, unicode):
+      body = body.encode("utf-8")
+    if "\\" in body:
+      body = body.decode("string_escape")
+  return body
+
+
+def parse_key_repr(key_repr):
+  """Creates a Key from its repr() without evaluating it.
+
+  Only calls to Key.from_path with string, integer and None arguments and
+  with the _app and namespace keyword arguments are accepted.
+
+  Raises:
+    DeserializationError if key_repr is not in that format.
+  """
+  match = _KEY_REPR_RE.match(key_repr)
+  if not match:
+    raise base.DeserializationError(u"Invalid key repr: '%s'" % key_repr)
+  arguments = match.group(1)
+  args = []
+  kwargs = {}
+  pos = 0
+  while arguments[pos:].strip():
+    match = _KEY_REPR_ARG_RE.match(arguments, pos)
+    if not match:
+      raise base.DeserializationError(u"Invalid key repr: '%s'" % key_repr)
+    pos = match.end()
+    if match.group("string") is not None:
+      value = _parse_string_literal(match.group("unicode"),
+                                    match.group("string"))
+    elif match.group("number") is not None:
+      value = int(match.group("number"))
+    else:
+      value = None
+    keyword = match.group("keyword")
+    if keyword is None:
+      if kwargs:
+        raise base.DeserializationError(u"Invalid key repr: '%s'" % key_repr)
+      args.append(value)
+    elif keyword in _KEY_REPR_KEYWORDS:
+      kwargs[str(keyword)] = value
+    else:
+      raise base.DeserializationError(u"Invalid key repr: '%s'" % key_repr)
+  return db.Key.from_path(*args, **kwargs)
+
+
 def resolve_key(model, key_data):
   """Creates a Key instance from a some data.
 
+  Keys resolved from strings are cached, so that keys which appear many times
+  in a fixture, such as common parents and reference targets, are only
+  decoded once.
+
   Args:
     model: The name of the model this key is being resolved for. Only used in
       the fourth case below (a plain key_name string).
     key_data: The data to create a key instance from. May be in four formats:
       * The str() output of a key instance. Eg. A base64 encoded string.
-      * The repr() output of a key instance. Eg. A string for eval().
+      * The repr() output of a key instance, which is parsed by
+        parse_key_repr.
       * A list of arguments to pass to db.Key.from_path.
       * A single string value, being the key_name of the instance. When this
         format is used the resulting key has no parent, and is for the model
@@ -156,15 +404,25 @@ def resolve_key(model, key_data):
     # The key_data is a from_path sequence.
     return db.Key.from_path(*key_data)
   elif isinstance(key_data, basestring):
-    if key_data.find("from_path") != -1:
-      # key_data is encoded in repr(key) format
-      return eval(key_data)
-    else:
-      try:
-        # key_data encoded a str(key) format
-        return db.Key(key_data)
-      except datastore_types.datastore_errors.BadKeyError, e:
-        # Final try, assume it's a plain key name for the model.
-        return db.Key.from_path(model, key_data)
+    cache_key = (model, key_data)
+    key = _key_cache.get(cache_key)
+    if key is None:
+      key = _resolve_key_string(model, key_data)
+      _key_cache.set(cache_key, key)
+    return key
   else:
     raise base.DeserializationError(u"Invalid key data: '%s'" % key_data)
+
+
+def _resolve_key_string(model, key_data):
+  if key_data.find("from_path") != -1:
+    # key_data is encoded in repr(key) format
+    return parse_key_repr(key_data)
+  if _ENCODED_KEY_RE.match(key_data):
+    try:
+      # key_data encoded a str(key) format
+      return db.Key(key_data)
+    except datastore_types.datastore_errors.BadKeyError, e:
+      pass
+  # Final try, assume it's a plain key name for the model.
+  return db.Key.from_path(model, key_data)
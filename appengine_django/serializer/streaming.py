@@ -0,0 +1,89 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Serializers that write each object to the output as soon as it is serialized.
+
+The standard Django serializers build the whole serialized document in memory
+before writing it. These versions serialize one object at a time, so when
+they are given a QuerySet, which fetches entities in batches, any number of
+entities can be serialized in constant memory. The output is the same as that
+of the standard serializers, except for whitespace.
+"""
+
+from django.core import serializers
+from django.core.serializers import python
+from django.utils import simplejson
+
+
+def serialize_objects(queryset, **options):
+  """Yields the python serialization of each object in turn."""
+  serializer = python.Serializer()
+  for obj in queryset:
+    yield serializer.serialize([obj], **dict(options))[0]
+
+
+def write_json(queryset, stream, indent=None, **options):
+  from django.core.serializers import json
+  separator = indent and ",\n" or ", "
+  stream.write("[")
+  first = True
+  for data in serialize_objects(queryset, **options):
+    if not first:
+      stream.write(separator)
+    first = False
+    stream.write(simplejson.dumps(data, cls=json.DjangoJSONEncoder,
+                                  indent=indent))
+  stream.write("]")
+
+
+def write_yaml(queryset, stream, indent=None, **options):
+  import yaml
+  from django.core.serializers import pyyaml
+  empty = True
+  for data in serialize_objects(queryset, **options):
+    # Each object is written as a single item list, which together form the
+    # block sequence that would have been written for the whole list.
+    yaml.dump([data], stream, Dumper=pyyaml.DjangoSafeDumper, indent=indent)
+    empty = False
+  if empty:
+    yaml.dump([], stream, Dumper=pyyaml.DjangoSafeDumper)
+
+
+def write_xml(queryset, stream, indent=None, **options):
+  serializers.get_serializer("xml")().serialize(queryset, stream=stream,
+                                                indent=indent, **options)
+
+
+WRITERS = {
+    "json": write_json,
+    "xml": write_xml,
+    "yaml": write_yaml,
+}
+
+
+def serialize(format, queryset, stream, **options):
+  """Serializes the objects in queryset to stream.
+
+  Formats without a streaming writer are serialized with the standard Django
+  serializer, writing the output once the queryset has been serialized. The
+  python format cannot be written to a stream, use serialize_objects instead.
+  """
+  writer = WRITERS.get(format)
+  if writer is None:
+    serializers.serialize(format, queryset, stream=stream, **options)
+  else:
+    writer(queryset, stream, **options)
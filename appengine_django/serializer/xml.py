@@ -20,9 +20,15 @@ Replaces the default Django XML serializer with one that uses the built in
 ToXml method for each entity.
 """
 
-from datetime import datetime
+from __future__ import absolute_import
+
 import re
 
+try:
+  from xml.etree import cElementTree as ElementTree
+except ImportError:
+  from xml.etree import ElementTree
+
 from django.conf import settings
 from django.core.serializers import base
 from django.core.serializers import xml_serializer
@@ -31,8 +37,13 @@ from django.db import models
 from google.appengine.api import datastore_types
 from google.appengine.ext import db
 
-from python import FakeParent
-from python import parse_datetime_with_microseconds
+from appengine_django.models import FIELD_DATE
+from appengine_django.models import FIELD_DATETIME
+from appengine_django.models import FIELD_REFERENCE
+from appengine_django.models import FIELD_TIME
+
+from appengine_django.serializer.python import FakeParent
+from appengine_django.serializer.python import parse_datetime
 
 getInnerText = xml_serializer.getInnerText
 
@@ -41,12 +52,18 @@ class Serializer(xml_serializer.Serializer):
   """A Django Serializer class to convert datastore models to XML.
 
   This class relies on the ToXml method of the entity behind each model to do
-  the hard work.
+  the hard work. Each entity is written to the output stream as soon as it
+  has been serialized, so large querysets are serialized in constant memory.
   """
 
-  def __init__(self, *args, **kwargs):
-    super(Serializer, self).__init__(*args, **kwargs)
-    self._objects = []
+  def start_serialization(self):
+    """Writes the XML headers."""
+    self.stream.write(u"""<?xml version="1.0" encoding="utf-8"?>\n""")
+    self.stream.write(u"""<django-objects version="1.0">\n""")
+
+  def end_serialization(self):
+    """Closes the root element."""
+    self.stream.write(u"""</django-objects>""")
 
   def handle_field(self, obj, field):
     """Fields are not handled individually."""
@@ -61,7 +78,7 @@ class Serializer(xml_serializer.Serializer):
     pass
 
   def end_object(self, obj):
-    """Serialize the object to XML and add to the list of objects to output.
+    """Serialize the object to XML and write it to the output stream.
 
     The output of ToXml is manipulated to replace the datastore model name in
     the "kind" tag with the Django model name (which includes the Django
@@ -70,23 +87,155 @@ class Serializer(xml_serializer.Serializer):
     xml = obj._entity.ToXml()
     xml = xml.replace(u"""kind="%s" """ % obj._entity.kind(),
                       u"""kind="%s" """ % unicode(obj._meta))
-    self._objects.append(xml)
+    self.stream.write(xml)
 
   def getvalue(self):
-    """Wrap the serialized objects with XML headers and return."""
-    str = u"""<?xml version="1.0" encoding="utf-8"?>\n"""
-    str += u"""<django-objects version="1.0">\n"""
-    str += u"".join(self._objects)
-    str += u"""</django-objects>"""
-    return str
+    """Returns the serialized objects if the output stream is in memory."""
+    if callable(getattr(self.stream, "getvalue", None)):
+      return self.stream.getvalue()
 
 
-class Deserializer(xml_serializer.Deserializer):
+def _get_inner_text(element):
+  """Returns the text of an element and its descendants, like getInnerText."""
+  inner_text = [element.text or u""]
+  for child in element:
+    inner_text.append(_get_inner_text(child))
+    inner_text.append(child.tail or u"")
+  return u"".join(inner_text)
+
+
+def _build_object(Model, key, properties):
+  """Creates a DeserializedObject from the parts of an <entity> node.
+
+  Args:
+    Model: The model class named by the entity's kind.
+    key: The encoded key of the entity.
+    properties: An iterable of (name, text) pairs for each <property> node.
+  """
+  data = {}
+  key = db.Key(key)
+  if key.name():
+    data["key_name"] = key.name()
+  parent = None
+  if key.parent():
+    parent = FakeParent(key.parent())
+  m2m_data = {}
+
+  # Deseralize each field.
+  for field_name, field_value in properties:
+    # If the field is missing the name attribute, bail (are you
+    # sensing a pattern here?)
+    if not field_name:
+        raise base.DeserializationError("<field> node is missing the 'name' "
+                                        "attribute")
+    field = Model._meta.field_map[field_name]
+    kind = Model._meta.field_kinds[field_name]
+    field_value = field_value.strip()
+
+    if kind == FIELD_REFERENCE:
+      m = re.match("tag:.*\[(.*)\]", field_value)
+      if not m:
+        raise base.DeserializationError(u"Invalid reference value: '%s'" %
+                                        field_value)
+      key = m.group(1)
+      key_obj = db.Key(key)
+      if not key_obj.name():
+        raise base.DeserializationError(u"Cannot load Reference with "
+                                        "unnamed key: '%s'" % field_value)
+      data[field.name] = key_obj
+    else:
+      # ToXml writes dates and times as complete datetimes.
+      if kind == FIELD_DATE:
+        field_value = parse_datetime(field_value).date()
+      elif kind == FIELD_TIME:
+        field_value = parse_datetime(field_value).time()
+      elif kind == FIELD_DATETIME:
+        field_value = parse_datetime(field_value)
+      data[field.name] = field.validate(field_value)
+
+  # Create the new model instance with all it's data, but no parent.
+  object = Model(**data)
+  # Now add the parent into the hidden attribute, bypassing the type checks
+  # in the Model's __init__ routine.
+  object._parent = parent
+  # When the deserialized object is saved our replacement DeserializedObject
+  # class will set object._parent to force the real parent model to be loaded
+  # the first time it is referenced.
+  return base.DeserializedObject(object, m2m_data)
+
+
+class _Utf8Reader(object):
+  """Encodes the unicode read from a stream, which expat does not accept.
+
+  The serialized XML declares its encoding as utf-8.
+  """
+
+  def __init__(self, stream):
+    self.stream = stream
+
+  def read(self, size=-1):
+    data = self.stream.read(size)
+    if isinstance(data, unicode):
+      data = data.encode("utf-8")
+    return data
+
+
+class Deserializer(base.Deserializer):
   """A Django Deserializer class to convert XML to Django objects.
 
-  This is a fairly manualy and simplistic XML parser, it supports just enough
-  functionality to read the keys and fields for an entity from the XML file and
-  construct a model object.
+  The XML is read incrementally with ElementTree's iterparse. Each <entity>
+  element is converted to a model object once it has been parsed and is then
+  discarded, so fixtures of any size are deserialized in constant memory.
+  """
+
+  def __init__(self, stream_or_string, **options):
+    super(Deserializer, self).__init__(stream_or_string, **options)
+    self.event_stream = ElementTree.iterparse(_Utf8Reader(self.stream),
+                                              events=("start", "end"))
+    self.root = None
+
+  def next(self):
+    """Returns the object for the next complete <entity> element."""
+    for event, element in self.event_stream:
+      if self.root is None:
+        self.root = element
+      elif event == "end" and element.tag == "entity":
+        deserialized = self._handle_object(element)
+        # Remove the entity, and anything before it, from the parsed tree.
+        self.root.clear()
+        return deserialized
+    raise StopIteration
+
+  def _get_model(self, element):
+    """Looks up the model named by the kind attribute of an element."""
+    model_identifier = element.get("kind")
+    if not model_identifier:
+      raise base.DeserializationError(
+          "<%s> node is missing the required 'kind' attribute" % element.tag)
+    try:
+      Model = models.get_model(*model_identifier.split("."))
+    except TypeError:
+      Model = None
+    if Model is None:
+      raise base.DeserializationError(
+          "<%s> node has invalid model identifier: '%s'" %
+          (element.tag, model_identifier))
+    return Model
+
+  def _handle_object(self, element):
+    """Convert an <entity> element to a DeserializedObject"""
+    return _build_object(
+        self._get_model(element), element.get("key"),
+        [(property_element.get("name"), _get_inner_text(property_element))
+         for property_element in element.getiterator("property")])
+
+
+class DomDeserializer(xml_serializer.Deserializer):
+  """The previous XML Deserializer, which expands each <entity> with minidom.
+
+  It produces the same objects as Deserializer but is slower and, as the
+  pulldom parser keeps the document it has read, uses memory in proportion to
+  the size of the input.
   """
 
   def next(self):
@@ -103,55 +252,7 @@ class Deserializer(xml_serializer.Deserializer):
 
   def _handle_object(self, node):
     """Convert an <entity> node to a DeserializedObject"""
-    Model = self._get_model_from_node(node, "kind")
-    data = {}
-    key = db.Key(node.getAttribute("key"))
-    if key.name():
-      data["key_name"] = key.name()
-    parent = None
-    if key.parent():
-      parent = FakeParent(key.parent())
-    m2m_data = {}
-
-    # Deseralize each field.
-    for field_node in node.getElementsByTagName("property"):
-      # If the field is missing the name attribute, bail (are you
-      # sensing a pattern here?)
-      field_name = field_node.getAttribute("name")
-      if not field_name:
-          raise base.DeserializationError("<field> node is missing the 'name' "
-                                          "attribute")
-      field = Model.properties()[field_name]
-      field_value = getInnerText(field_node).strip()
-
-      if isinstance(field, db.Reference):
-        m = re.match("tag:.*\[(.*)\]", field_value)
-        if not m:
-          raise base.DeserializationError(u"Invalid reference value: '%s'" %
-                                          field_value)
-        key = m.group(1)
-        key_obj = db.Key(key)
-        if not key_obj.name():
-          raise base.DeserializationError(u"Cannot load Reference with "
-                                          "unnamed key: '%s'" % field_value)
-        data[field.name] = key_obj
-      else:
-        format = '%Y-%m-%d %H:%M:%S'
-        if isinstance(field, db.DateProperty):
-          field_value = datetime.strptime(field_value, format).date()
-        elif isinstance(field, db.TimeProperty):
-          field_value = parse_datetime_with_microseconds(field_value,
-                                                         format).time()
-        elif isinstance(field, db.DateTimeProperty):
-          field_value = parse_datetime_with_microseconds(field_value, format)
-        data[field.name] = field.validate(field_value)
-
-    # Create the new model instance with all it's data, but no parent.
-    object = Model(**data)
-    # Now add the parent into the hidden attribute, bypassing the type checks
-    # in the Model's __init__ routine.
-    object._parent = parent
-    # When the deserialized object is saved our replacement DeserializedObject
-    # class will set object._parent to force the real parent model to be loaded
-    # the first time it is referenced.
-    return base.DeserializedObject(object, m2m_data)
+    return _build_object(
+        self._get_model_from_node(node, "kind"), node.getAttribute("key"),
+        [(field_node.getAttribute("name"), getInnerText(field_node))
+         for field_node in node.getElementsByTagName("property")])
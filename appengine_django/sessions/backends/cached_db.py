@@ -0,0 +1,138 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A memcache fronted, write-behind session store for Google App Engine.
+
+Sessions are served from memcache and the datastore Session entity is only
+read when the cached copy has been evicted. The entity is treated as a durable
+copy of the session and is only written when the session is created, when its
+contents change, or when it has not been written for SESSION_FLUSH_INTERVAL
+seconds. Requests that only bump the expiry date of a session (for example
+with SESSION_SAVE_EVERY_REQUEST) therefore normally cost no datastore RPCs.
+
+To use this store set:
+  SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+"""
+
+from datetime import datetime
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends import base
+from django.core.exceptions import SuspiciousOperation
+
+from google.appengine.api import memcache
+
+from appengine_django.sessions.backends.db import SessionStore as DBStore
+
+
+KEY_PREFIX = "django_session:"
+
+# Default number of seconds a modified expiry date may be held in memcache
+# before it is written back to the datastore.
+DEFAULT_FLUSH_INTERVAL = 300
+
+# The longest relative expiry time accepted by memcache. Longer values are
+# interpreted as absolute timestamps.
+MAX_CACHE_TIME = 30 * 24 * 60 * 60
+
+
+class SessionStore(DBStore):
+  """A memcache fronted session store with a datastore fallback."""
+
+  def __init__(self, session_key=None):
+    super(SessionStore, self).__init__(session_key)
+    # The (session_data, expire_date, flushed) tuple last read from or
+    # written to memcache for this session.
+    self._cache_entry = None
+
+  def load(self):
+    entry = self._get_cache_entry(self.session_key)
+    if entry is None:
+      session = self._get_session(self.session_key)
+      if session:
+        entry = self._set_cache_entry(self.session_key, session.session_data,
+                                      session.expire_date, datetime.now())
+    if entry:
+      try:
+        data = self.decode(entry[0])
+        self._cache_entry = entry
+        return data
+      except SuspiciousOperation:
+        # Create a new session_key for extra security.
+        pass
+    self.session_key = self._get_new_session_key()
+    self._session_cache = {}
+    self.save()
+    # Ensure the user is notified via a new cookie.
+    self.modified = True
+    return {}
+
+  def save(self, must_create=False):
+    if must_create and self.exists(self.session_key):
+      raise base.CreateError
+    session_data = self.encode(self._session)
+    expire_date = self.get_expiry_date()
+    now = datetime.now()
+    entry = self._cache_entry
+    if (must_create or entry is None or entry[0] != session_data or
+        now - entry[2] >= self._get_flush_interval()):
+      # New or modified sessions, and sessions whose durable copy is older
+      # than the flush interval, are written through to the datastore. The
+      # write may still be skipped if this store has already written the
+      # same data, in which case the durable copy is no newer than before.
+      if (self._put_session(session_data, expire_date, force=must_create) or
+          entry is None):
+        flushed = now
+      else:
+        flushed = entry[2]
+    else:
+      flushed = entry[2]
+    self._set_cache_entry(self.session_key, session_data, expire_date,
+                          flushed)
+
+  def exists(self, session_key):
+    if self._get_cache_entry(session_key):
+      return True
+    return super(SessionStore, self).exists(session_key)
+
+  def delete(self, session_key=None):
+    if session_key is None:
+      session_key = self._session_key
+    memcache.delete(KEY_PREFIX + session_key)
+    self._cache_entry = None
+    super(SessionStore, self).delete(session_key)
+
+  def _get_flush_interval(self):
+    return timedelta(seconds=getattr(settings, "SESSION_FLUSH_INTERVAL",
+                                     DEFAULT_FLUSH_INTERVAL))
+
+  def _get_cache_entry(self, session_key):
+    """Returns the cached entry for session_key or None if not cached."""
+    entry = memcache.get(KEY_PREFIX + session_key)
+    if entry is not None and entry[1] > datetime.now():
+      return entry
+    return None
+
+  def _set_cache_entry(self, session_key, session_data, expire_date, flushed):
+    """Stores the session in memcache until it expires."""
+    entry = (session_data, expire_date, flushed)
+    delta = expire_date - datetime.now()
+    timeout = min(delta.days * 86400 + delta.seconds, MAX_CACHE_TIME)
+    if timeout > 0:
+      memcache.set(KEY_PREFIX + session_key, entry, time=timeout)
+    self._cache_entry = entry
+    return entry
@@ -15,21 +15,59 @@
 # limitations under the License.
 
 from datetime import datetime
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.sessions.backends import base
 from django.core.exceptions import SuspiciousOperation
+from django.utils.hashcompat import md5_constructor
 
+from google.appengine.ext import db
+
+from appengine_django.sessions import codec
+from appengine_django.sessions.layouts import get_key_layout
 from appengine_django.sessions.models import Session
 
 
+# Default number of seconds the expiry date of an otherwise unchanged session
+# may move before the session is written back to the datastore.
+DEFAULT_EXPIRY_GRANULARITY = 60
+
+# Counts of the session writes performed and skipped by this process.
+write_counts = {"performed": 0, "skipped": 0}
+
+
 class SessionStore(base.SessionBase):
-  """A key-based session store for Google App Engine."""
+  """A key-based session store for Google App Engine.
+
+  The store remembers a digest of the session data and the expiry date it last
+  read or wrote for the session. Saving a session whose data is unchanged and
+  whose expiry date has moved by less than SESSION_EXPIRY_GRANULARITY seconds
+  does not write to the datastore.
+
+  The key name each session is stored under is chosen by the layout selected
+  with the SESSION_KEY_LAYOUT setting, see appengine_django.sessions.layouts.
+  Session data is encoded with the codec selected by the SESSION_CODEC
+  setting, see appengine_django.sessions.codec.
+  """
+
+  def __init__(self, session_key=None):
+    super(SessionStore, self).__init__(session_key)
+    # The (session_key, digest, expire_date) last persisted for this session.
+    self._persisted = None
+    # The key of an entity to remove once the session is written under the
+    # preferred key name of the current layout.
+    self._migrate_from = None
 
   def load(self):
     session = self._get_session(self.session_key)
     if session:
       try:
-        return self.decode(session.session_data)
+        data = self.decode(session.session_data)
+        self._persisted = (self.session_key,
+                           md5_constructor(session.session_data).digest(),
+                           session.expire_date)
+        return data
       except SuspiciousOperation:
         # Create a new session_key for extra security.
         pass
@@ -43,14 +81,62 @@ class SessionStore(base.SessionBase):
   def save(self, must_create=False):
     if must_create and self.exists(self.session_key):
       raise base.CreateError
+    self._put_session(self.encode(self._session), self.get_expiry_date(),
+                      force=must_create)
+
+  def _put_session(self, session_data, expire_date, force=False):
+    """Writes the encoded session data to the datastore.
+
+    Args:
+      session_data: The encoded session data.
+      expire_date: The datetime the session expires at.
+      force: Write the session even if it appears to be unchanged.
+
+    Returns:
+      True if the session was written, False if the write was skipped.
+    """
+    digest = md5_constructor(session_data).digest()
+    if not force and self._persisted:
+      session_key, old_digest, old_expire_date = self._persisted
+      granularity = timedelta(seconds=getattr(
+          settings, "SESSION_EXPIRY_GRANULARITY", DEFAULT_EXPIRY_GRANULARITY))
+      if (session_key == self.session_key and old_digest == digest and
+          abs(expire_date - old_expire_date) < granularity):
+        write_counts["skipped"] += 1
+        return False
     session = Session(
-        key_name='k:' + self.session_key,
-        session_data = self.encode(self._session),
-        expire_date = self.get_expiry_date())
+        key_name=get_key_layout().key_names(self.session_key)[0],
+        session_data = session_data,
+        expire_date = expire_date)
     session.put()
+    if self._migrate_from:
+      db.delete(self._migrate_from)
+      self._migrate_from = None
+    self._persisted = (self.session_key, digest, expire_date)
+    write_counts["performed"] += 1
+    return True
+
+  def encode(self, session_dict):
+    session_codec = codec.get_codec()
+    if session_codec is None:
+      return super(SessionStore, self).encode(session_dict)
+    return session_codec.encode(session_dict)
+
+  def decode(self, session_data):
+    if codec.is_binary(session_data):
+      return codec.decode(session_data)
+    return super(SessionStore, self).decode(session_data)
+
+  def _get_new_session_key(self):
+    return get_key_layout().new_session_key(
+        super(SessionStore, self)._get_new_session_key())
 
   def exists(self, session_key):
-    return Session.get_by_key_name('k:' + session_key) is not None
+    for session in Session.get_by_key_name(
+        get_key_layout().key_names(session_key)):
+      if session:
+        return True
+    return False
 
   def delete(self, session_key=None):
     if session_key is None:
@@ -58,11 +144,17 @@ class SessionStore(base.SessionBase):
     session = self._get_session(session_key=session_key)
     if session:
       session.delete()
+    self._persisted = None
 
   def _get_session(self, session_key):
-    session = Session.get_by_key_name('k:' + session_key)
-    if session:
+    key_names = get_key_layout().key_names(session_key)
+    for key_name, session in zip(key_names,
+                                 Session.get_by_key_name(key_names)):
+      if not session:
+        continue
       if session.expire_date > datetime.now():
+        if key_name != key_names[0]:
+          self._migrate_from = session.key()
         return session
       session.delete()
     return None
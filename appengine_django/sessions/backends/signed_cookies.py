@@ -0,0 +1,163 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A session store that keeps the session data in a signed cookie.
+
+The encoded session is stored in the session cookie itself, signed with an
+HMAC keyed by SECRET_KEY and optionally compressed. Small sessions therefore
+cost no datastore or memcache RPCs at all. Sessions whose signed payload is
+longer than SESSION_COOKIE_MAX_SIZE bytes are transparently stored in the
+datastore Session model instead, in which case the cookie holds a normal
+session key.
+
+To use this store set:
+  SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+Note that the session data is readable by the client, only tampering is
+detected. Do not store secrets in sessions when using this store.
+"""
+
+import base64
+import hmac
+import time
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.utils.hashcompat import sha_constructor
+
+from appengine_django.sessions.backends.db import SessionStore as DBStore
+from appengine_django.sessions.codec import constant_time_compare
+
+
+# Default maximum length of the signed cookie value. Browsers limit the
+# total cookie size to around 4KB, including the name and attributes.
+DEFAULT_MAX_SIZE = 2048
+
+# Separates the payload, expiry time and signature in the cookie value.
+# Datastore session keys never contain it.
+SEPARATOR = ":"
+
+# Marks a payload that has been compressed.
+COMPRESSED_MARKER = "."
+
+# Salt mixed into SECRET_KEY so that the signatures cannot be reused
+# elsewhere.
+SALT = "appengine_django.sessions.backends.signed_cookies"
+
+
+class SessionStore(DBStore):
+  """A signed cookie session store with a datastore fallback."""
+
+  def _get_session_key(self):
+    if not self._session_key:
+      self._session_key = self._sign(self.encode(self._session))
+    return self._session_key
+
+  def _set_session_key(self, session_key):
+    self._session_key = session_key
+
+  session_key = property(_get_session_key, _set_session_key)
+
+  def load(self):
+    try:
+      if self._is_signed(self._session_key):
+        return self.decode(self._unsign(self._session_key))
+      session = self._get_session(self._session_key)
+      if session:
+        return self.decode(session.session_data)
+    except SuspiciousOperation:
+      pass
+    # Discard the invalid cookie and ensure the user is sent a new one.
+    self._session_key = None
+    self.modified = True
+    return {}
+
+  def save(self, must_create=False):
+    old_key = self._session_key
+    cookie = self._sign(self.encode(self._session))
+    if len(cookie) <= getattr(settings, "SESSION_COOKIE_MAX_SIZE",
+                              DEFAULT_MAX_SIZE):
+      self._session_key = cookie
+      if old_key and not self._is_signed(old_key):
+        # The session has shrunk, the datastore copy is no longer needed.
+        super(SessionStore, self).delete(old_key)
+      return
+    # Too large for a cookie, keep the session in the datastore.
+    if not old_key or self._is_signed(old_key):
+      self._session_key = self._get_new_session_key()
+      must_create = True
+    super(SessionStore, self).save(must_create)
+
+  def exists(self, session_key):
+    if self._is_signed(session_key):
+      return False
+    return super(SessionStore, self).exists(session_key)
+
+  def delete(self, session_key=None):
+    if session_key is None:
+      session_key = self._session_key
+      self._session_key = None
+      self._session_cache = {}
+      self.modified = True
+    if session_key and not self._is_signed(session_key):
+      super(SessionStore, self).delete(session_key)
+
+  def create(self):
+    # A new cookie is generated when the session is saved.
+    self._session_key = None
+    self._session_cache = {}
+    self.modified = True
+
+  def _is_signed(self, session_key):
+    return bool(session_key) and SEPARATOR in session_key
+
+  def _signature(self, value):
+    return hmac.new(SALT + settings.SECRET_KEY, value,
+                    sha_constructor).hexdigest()
+
+  def _sign(self, session_data):
+    """Returns the signed cookie value for the encoded session data."""
+    payload = session_data
+    marker = ""
+    if getattr(settings, "SESSION_COOKIE_COMPRESS", True):
+      compressed = zlib.compress(session_data)
+      if len(compressed) < len(session_data):
+        payload = compressed
+        marker = COMPRESSED_MARKER
+    expiry = int(time.mktime(self.get_expiry_date().timetuple()))
+    value = "%s%s%s%x" % (marker, base64.urlsafe_b64encode(payload),
+                          SEPARATOR, expiry)
+    return "%s%s%s" % (value, SEPARATOR, self._signature(value))
+
+  def _unsign(self, cookie):
+    """Returns the encoded session data from a signed cookie value.
+
+    Raises:
+      SuspiciousOperation if the signature is invalid or the cookie expired.
+    """
+    try:
+      value, signature = str(cookie).rsplit(SEPARATOR, 1)
+      if not constant_time_compare(signature, self._signature(value)):
+        raise SuspiciousOperation("User tampered with session cookie.")
+      payload, expiry = value.split(SEPARATOR, 1)
+      if int(expiry, 16) < time.time():
+        raise SuspiciousOperation("Session cookie has expired.")
+      if payload.startswith(COMPRESSED_MARKER):
+        return zlib.decompress(base64.urlsafe_b64decode(payload[1:]))
+      return base64.urlsafe_b64decode(payload)
+    except (ValueError, TypeError, zlib.error):
+      raise SuspiciousOperation("Malformed session cookie.")
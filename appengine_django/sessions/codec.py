@@ -0,0 +1,118 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact binary encodings for session data.
+
+Django encodes sessions as a base64 encoded pickle followed by a hash, which
+inflates every session by about a third. The codecs in this module store the
+pickle as raw bytes instead, optionally compressed with zlib:
+
+  <version byte><20 byte HMAC-SHA1 of version and body><body>
+
+The codec used for new sessions is selected with the SESSION_CODEC setting:
+
+  'legacy' - The standard Django encoding. The default.
+  'binary' - The raw pickle.
+  'zlib' - The pickle compressed with zlib, when that makes it smaller.
+
+Sessions are always decoded according to their version byte, so sessions
+written with any codec (including the legacy encoding, which never starts with
+a version byte) can be read whatever the current setting is.
+"""
+
+import cPickle as pickle
+import hmac
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.utils.hashcompat import sha_constructor
+
+
+RAW_VERSION = "\x01"
+ZLIB_VERSION = "\x02"
+VERSIONS = (RAW_VERSION, ZLIB_VERSION)
+
+MAC_LENGTH = 20
+
+
+def _mac(data):
+  return hmac.new(settings.SECRET_KEY, data, sha_constructor).digest()
+
+
+def constant_time_compare(val1, val2):
+  """Returns True if the two strings are equal, without leaking timing."""
+  if len(val1) != len(val2):
+    return False
+  result = 0
+  for x, y in zip(val1, val2):
+    result |= ord(x) ^ ord(y)
+  return result == 0
+
+
+class BinaryCodec(object):
+  """Encodes sessions as raw, optionally compressed, pickles."""
+
+  def __init__(self, compress=False):
+    self.compress = compress
+
+  def encode(self, session_dict):
+    """Returns the encoded form of the session dictionary."""
+    body = pickle.dumps(session_dict, pickle.HIGHEST_PROTOCOL)
+    version = RAW_VERSION
+    if self.compress:
+      compressed = zlib.compress(body)
+      if len(compressed) < len(body):
+        body = compressed
+        version = ZLIB_VERSION
+    return version + _mac(version + body) + body
+
+
+CODECS = {
+    "legacy": None,
+    "binary": BinaryCodec(),
+    "zlib": BinaryCodec(compress=True),
+}
+
+
+def get_codec():
+  """Returns the codec selected by SESSION_CODEC, None for legacy encoding."""
+  return CODECS[getattr(settings, "SESSION_CODEC", "legacy")]
+
+
+def is_binary(session_data):
+  """Returns True if session_data was encoded by a codec in this module."""
+  return session_data[:1] in VERSIONS
+
+
+def decode(session_data):
+  """Decodes session data encoded by a codec in this module.
+
+  Raises:
+    SuspiciousOperation if the data has been tampered with.
+  """
+  version = session_data[:1]
+  mac = session_data[1:MAC_LENGTH + 1]
+  body = session_data[MAC_LENGTH + 1:]
+  if not constant_time_compare(_mac(version + body), mac):
+    raise SuspiciousOperation("Session data has been tampered with.")
+  try:
+    if version == ZLIB_VERSION:
+      body = zlib.decompress(body)
+    return pickle.loads(body)
+  except:
+    # Match Django, which discards sessions that cannot be unpickled.
+    return {}
@@ -0,0 +1,127 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Key name layouts for the datastore Session model.
+
+The layout used for new sessions is selected with the SESSION_KEY_LAYOUT
+setting:
+
+  'legacy' - 'k:<session_key>'. The default, as used by earlier releases.
+  'hashed' - 'x:<hash prefix>:<session_key>'. Spreads sessions evenly over the
+      key space even when the session keys themselves are not random.
+  'hourly' - 'h:<YYYYMMDDHH>-<random>'. New session keys are prefixed with
+      the hour they were created in, bucketing the sessions so that old
+      buckets can be dropped with a key range scan (see ./manage.py
+      cleanup_sessions --max-age). Note that all sessions created in the
+      same hour are written to one key range.
+
+While SESSION_KEY_LAYOUT_FALLBACK is True (the default) sessions stored under
+the legacy layout are still found, and are moved to the new layout the next
+time they are written where the new layout allows it.
+"""
+
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.hashcompat import md5_constructor
+
+
+class LegacyKeyLayout(object):
+  """Stores each session under 'k:<session_key>'."""
+
+  prefix = "k:"
+
+  def new_session_key(self, session_key):
+    """Returns the key to use for a new session given a random key."""
+    return session_key
+
+  def key_name(self, session_key):
+    """Returns the key name for session_key, or None if not applicable."""
+    return self.prefix + session_key
+
+  def key_names(self, session_key):
+    """Returns the key names session_key may be stored under.
+
+    The first entry is the key name the session should be written to.
+    """
+    names = []
+    name = self.key_name(session_key)
+    if name is not None:
+      names.append(name)
+    legacy_name = LegacyKeyLayout.key_name(self, session_key)
+    if legacy_name not in names and (
+        not names or getattr(settings, "SESSION_KEY_LAYOUT_FALLBACK", True)):
+      # Keys that do not fit the layout can only be stored the legacy way.
+      names.append(legacy_name)
+    return names
+
+
+class HashedKeyLayout(LegacyKeyLayout):
+  """Stores each session under 'x:<hash prefix>:<session_key>'."""
+
+  prefix = "x:"
+
+  # The number of hex digits of the hash used as the prefix.
+  hash_length = 2
+
+  def key_name(self, session_key):
+    digest = md5_constructor(session_key).hexdigest()
+    return "%s%s:%s" % (self.prefix, digest[:self.hash_length], session_key)
+
+
+class HourlyKeyLayout(LegacyKeyLayout):
+  """Stores each session under 'h:<creation hour>-<random>'."""
+
+  prefix = "h:"
+  bucket_format = "%Y%m%d%H"
+  bucket_length = 10
+  separator = "-"
+
+  def new_session_key(self, session_key):
+    return "%s%s%s" % (self.bucket(datetime.now()), self.separator,
+                       session_key)
+
+  def key_name(self, session_key):
+    bucket, sep, rest = session_key.partition(self.separator)
+    if (not sep or not rest or len(bucket) != self.bucket_length or
+        not bucket.isdigit()):
+      return None
+    return self.prefix + session_key
+
+  def bucket(self, when):
+    """Returns the bucket name for sessions created at the datetime when."""
+    return when.strftime(self.bucket_format)
+
+  def bucket_range(self, before):
+    """Returns the key name range of buckets created before a datetime.
+
+    Returns:
+      A (start, end) tuple of key names. Key names k in the range satisfy
+      start <= k < end.
+    """
+    return self.prefix, self.prefix + self.bucket(before)
+
+
+LAYOUTS = {
+    "legacy": LegacyKeyLayout(),
+    "hashed": HashedKeyLayout(),
+    "hourly": HourlyKeyLayout(),
+}
+
+
+def get_key_layout():
+  """Returns the layout selected by the SESSION_KEY_LAYOUT setting."""
+  return LAYOUTS[getattr(settings, "SESSION_KEY_LAYOUT", "legacy")]
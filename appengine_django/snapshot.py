@@ -0,0 +1,260 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A snapshot of precompiled code used to speed up cold starts.
+
+The appserver cannot write .pyc files, so every module imported by a new
+instance is compiled from source. ./manage.py snapshot_bytecode compiles the
+helper, the project's apps and Django ahead of time into a single file
+(bytecode.snapshot) which is uploaded with the application.
+
+The snapshot is only used by versions of Python with the same bytecode magic
+number as the one that wrote it. Each module is only loaded from the snapshot
+if the source that would otherwise be imported is unchanged, so a stale
+snapshot is never harmful, only slower.
+
+The snapshot file starts with a marshalled header of (magic number, index)
+where the index maps each module name to a tuple of (is_package, source size,
+source CRC-32, offset, length, path entry). The marshalled code objects follow
+the header, at the given offset from its end. The path entry is the sys.path
+entry that top level modules were found in, relative to the directory of the
+snapshot, or None for modules found outside that directory.
+
+This module must not import Django as it is used to load Django.
+"""
+
+import imp
+import marshal
+import os
+import sys
+import types
+import zlib
+
+
+def _crc(data):
+  return zlib.crc32(data) & 0xffffffff
+
+
+def _read_source(filename):
+  source = open(filename, "rb")
+  try:
+    return source.read()
+  finally:
+    source.close()
+
+
+def _relative_entry(root, base_dir):
+  """Returns root relative to base_dir, or None if it is not inside it."""
+  root = os.path.abspath(root)
+  base_dir = os.path.abspath(base_dir)
+  if root == base_dir:
+    return os.curdir
+  if root.startswith(base_dir + os.sep):
+    return root[len(base_dir) + 1:]
+  return None
+
+
+def _find_in_directory(directory, name):
+  """Returns the file the import machinery would import name from, or None.
+
+  Packages are found before modules and modules are found in the order of
+  imp.get_suffixes(), which puts extension modules first.
+  """
+  package_dir = os.path.join(directory, name)
+  if os.path.isdir(package_dir):
+    for init in ("__init__.py", "__init__.pyc", "__init__.pyo"):
+      filename = os.path.join(package_dir, init)
+      if os.path.isfile(filename):
+        return filename
+  for suffix, mode, kind in imp.get_suffixes():
+    filename = os.path.join(directory, name + suffix)
+    if os.path.isfile(filename):
+      return filename
+  return None
+
+
+def find_sources(name, filename):
+  """Yields (module name, is_package, path) for a module and its submodules.
+
+  Args:
+    name: The name of a top level module or package.
+    filename: The module's __file__.
+  """
+  if not os.path.basename(filename).startswith("__init__."):
+    yield name, False, os.path.splitext(filename)[0] + ".py"
+    return
+  package_dir = os.path.dirname(filename)
+  for directory, dirnames, filenames in os.walk(package_dir):
+    if "__init__.py" not in filenames:
+      # Not a package, so neither it nor its subdirectories can be imported.
+      del dirnames[:]
+      continue
+    dirnames.sort()
+    package = ".".join([name] + directory[len(package_dir):].split(os.sep)[1:])
+    for source in sorted(filenames):
+      if not source.endswith(".py"):
+        continue
+      if source == "__init__.py":
+        yield package, True, os.path.join(directory, source)
+      else:
+        yield "%s.%s" % (package, source[:-3]), False, \
+            os.path.join(directory, source)
+
+
+def build_snapshot(modules, snapshot_path):
+  """Compiles modules and all of their submodules into a snapshot.
+
+  Args:
+    modules: A list of (name, filename) tuples giving the name and __file__
+      of each top level module or package to include.
+    snapshot_path: The file to write.
+
+  Returns:
+    A tuple of (number of modules saved, bytes written, list of the paths of
+    the sources that could not be compiled).
+  """
+  index = {}
+  blobs = []
+  offset = 0
+  failed = []
+  base_dir = os.path.dirname(snapshot_path)
+  for top_name, top_filename in modules:
+    root = os.path.dirname(top_filename)
+    if os.path.basename(top_filename).startswith("__init__."):
+      root = os.path.dirname(root)
+    entry = _relative_entry(root, base_dir)
+    for name, is_package, path in find_sources(top_name, top_filename):
+      source = _read_source(path)
+      # Code is compiled with paths relative to the sys.path entry, which
+      # linecache resolves against sys.path when showing tracebacks.
+      try:
+        code = compile(source.replace("\r\n", "\n") + "\n",
+                       path[len(root) + 1:], "exec")
+      except SyntaxError, e:
+        failed.append(path)
+        continue
+      blob = marshal.dumps(code)
+      index[name] = (is_package, len(source), _crc(source), offset, len(blob),
+                     entry)
+      blobs.append(blob)
+      offset += len(blob)
+  snapshot = open(snapshot_path, "wb")
+  try:
+    marshal.dump((imp.get_magic(), index), snapshot)
+    for blob in blobs:
+      snapshot.write(blob)
+    size = snapshot.tell()
+  finally:
+    snapshot.close()
+  return len(index), size, failed
+
+
+def load_snapshot(snapshot_path):
+  """Returns a SnapshotImporter for the snapshot, or None.
+
+  None is returned if the snapshot does not exist or was written by a
+  version of Python with a different bytecode format.
+  """
+  try:
+    snapshot = open(snapshot_path, "rb")
+    try:
+      magic, index = marshal.load(snapshot)
+      data_start = snapshot.tell()
+    finally:
+      snapshot.close()
+  except (IOError, EOFError, ValueError, TypeError), e:
+    return None
+  if magic != imp.get_magic():
+    return None
+  return SnapshotImporter(snapshot_path, index, data_start)
+
+
+class SnapshotImporter(object):
+  """Imports modules using the code saved in a snapshot.
+
+  The importer finds modules the same way as the normal import machinery, by
+  searching sys.path or the package's __path__. It only imports from the
+  snapshot if the first entry providing the module is the one the snapshot
+  was built from, and the source found there matches the snapshot's source.
+  Otherwise the module is left to the normal import machinery.
+  """
+
+  def __init__(self, snapshot_path, index, data_start):
+    self.snapshot_path = snapshot_path
+    self.base_dir = os.path.dirname(os.path.abspath(snapshot_path))
+    self.index = index
+    self.data_start = data_start
+    self._found = {}
+
+  def find_module(self, fullname, path=None):
+    entry = self.index.get(fullname)
+    if entry is None:
+      return None
+    is_package, size, crc, offset, length, path_entry = entry
+    name = fullname.split(".")[-1]
+    for directory in path or sys.path:
+      if not os.path.isdir(directory or os.curdir):
+        # Eg. a zipfile, which is searched by its own importer.
+        importer = sys.path_importer_cache.get(directory)
+        if importer is not None and importer.find_module(fullname):
+          return None
+        continue
+      filename = _find_in_directory(directory, name)
+      if filename is None:
+        continue
+      if is_package:
+        expected = os.path.join(directory, name, "__init__.py")
+      else:
+        expected = os.path.join(directory, name + ".py")
+      if filename != expected:
+        # Shadowed by a package, an extension or compiled module.
+        return None
+      if (path is None and path_entry is not None and
+          os.path.abspath(directory or os.curdir) !=
+          os.path.normpath(os.path.join(self.base_dir, path_entry))):
+        return None
+      source = _read_source(filename)
+      if len(source) != size or _crc(source) != crc:
+        return None
+      self._found[fullname] = filename
+      return self
+    return None
+
+  def get_code(self, fullname):
+    """Returns the code object saved for the module."""
+    offset, length = self.index[fullname][3:5]
+    snapshot = open(self.snapshot_path, "rb")
+    try:
+      snapshot.seek(self.data_start + offset)
+      return marshal.loads(snapshot.read(length))
+    finally:
+      snapshot.close()
+
+  def load_module(self, fullname):
+    if fullname in sys.modules:
+      return sys.modules[fullname]
+    filename = self._found.pop(fullname)
+    code = self.get_code(fullname)
+    module = sys.modules.setdefault(fullname, types.ModuleType(fullname))
+    module.__file__ = filename
+    if self.index[fullname][0]:
+      module.__path__ = [os.path.dirname(filename)]
+    try:
+      exec code in module.__dict__
+    except:
+      del sys.modules[fullname]
+      raise
+    return sys.modules[fullname]
@@ -22,7 +22,9 @@ application.
 
 All _test.py files inside this package are imported and any classes derived
 from unittest.TestCase are then referenced from this file itself so that they
-appear at the top level of the tests "module" that Django will import.
+appear at the top level of the tests "module" that Django will import. The
+benchmarks in benchmarks.py are included as well when the
+APPENGINE_DJANGO_BENCHMARKS environment variable is set.
 """
 
 
@@ -33,11 +35,15 @@ import unittest
 
 TEST_RE = r"^.*_test.py$"
 
+BENCHMARKS_FILENAME = "benchmarks.py"
+
 # Search through every file inside this package.
 test_names = []
 test_dir = os.path.dirname( __file__)
 for filename in os.listdir(test_dir):
-  if not re.match(TEST_RE, filename):
+  if not (re.match(TEST_RE, filename) or
+          (filename == BENCHMARKS_FILENAME and
+           os.environ.get("APPENGINE_DJANGO_BENCHMARKS"))):
     continue
   # Import the test file and find all TestClass clases inside it.
   test_module = __import__('appengine_django.tests.%s' %
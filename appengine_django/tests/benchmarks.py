@@ -0,0 +1,244 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks for the helper, reported with logging.info.
+
+The benchmarks only time the code and assert nothing about the timings, so
+they are not part of the normal test run. They are run along with the tests
+when the APPENGINE_DJANGO_BENCHMARKS environment variable is set, eg.
+
+  APPENGINE_DJANGO_BENCHMARKS=1 ./manage.py test appengine_django
+"""
+
+
+import logging
+import os
+import sys
+import time
+import unittest
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+from django.core import serializers
+from django.core.handlers.wsgi import WSGIHandler
+
+from google.appengine.ext import db
+
+from appengine_django.models import RegistrationTestModel
+from appengine_django.serializer import python as python_serializer
+from appengine_django.serializer import xml as xml_serializer
+from appengine_django.tests.query_test import QueryTestModel
+from appengine_django.tests.serialization_test import ModelA
+from appengine_django.tests.startup_test import run_startup
+
+import main
+
+
+# The number of entities in the deserialization benchmarks. Set to 100000 to
+# compare the XML deserializers on a large fixture.
+DESERIALIZATION_ENTITIES = 1000
+
+# The number of times each startup is measured.
+STARTUP_RUNS = 3
+
+# The number of simulated requests used by the request overhead benchmark.
+REQUESTS = 200
+
+# The number of entities used by the bulk operation benchmark.
+BULK_ENTITIES = 200
+
+# The number of rows fetched by the projection benchmark. Timings are reported
+# per 10,000 rows.
+PROJECTION_ROWS = 1000
+
+
+def measure_deserializer(deserializer_class, data):
+  """Deserializes data, returning the seconds taken and the peak memory used.
+
+  The memory is measured by deserializing again in a child process and is
+  the growth, in KB, of the child's maximum resident set size. It is None if
+  the platform cannot fork or report the resident set size.
+  """
+  start = time.time()
+  for deserialized in deserializer_class(data):
+    pass
+  seconds = time.time() - start
+  if resource is None or not hasattr(os, "fork"):
+    return seconds, None
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if not pid:
+    try:
+      os.close(read_fd)
+      before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      for deserialized in deserializer_class(data):
+        pass
+      after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      os.write(write_fd, str(after - before))
+    finally:
+      os._exit(0)
+  os.close(write_fd)
+  peak = os.read(read_fd, 64)
+  os.close(read_fd)
+  os.waitpid(pid, 0)
+  return seconds, peak and int(peak) or None
+
+
+def _approximate_size(obj):
+  """Returns the size of obj and of its attribute dictionary, if any."""
+  size = sys.getsizeof(obj)
+  if hasattr(obj, "__dict__"):
+    size += sys.getsizeof(obj.__dict__)
+  return size
+
+
+class DeserializationBenchmark(unittest.TestCase):
+  """Times the deserialization of fixtures."""
+
+  def testPythonDeserializer(self):
+    """Reports the time taken to deserialize objects with dates."""
+    objects = [{"model": "tests.modelc", "pk": "bench%d" % i,
+                "fields": {"dt_value": "2008-05-13 01:02:03.%06d" % i,
+                           "d_value": "2008-05-13",
+                           "t_value": "01:02:03"}}
+               for i in range(DESERIALIZATION_ENTITIES)]
+    start = time.time()
+    list(python_serializer.Deserializer(objects))
+    seconds = time.time() - start
+    start = time.time()
+    for i in range(DESERIALIZATION_ENTITIES):
+      python_serializer.parse_datetime_with_microseconds(
+          "2008-05-13 01:02:03.%06d" % i, "%Y-%m-%d %H:%M:%S")
+    strptime_seconds = time.time() - start
+    logging.info("Deserialized %d objects in %.1fms, parsing their datetimes "
+                 "with strptime alone takes %.1fms" %
+                 (DESERIALIZATION_ENTITIES, seconds * 1000,
+                  strptime_seconds * 1000))
+
+  def testXmlDeserializers(self):
+    """Reports the throughput and memory use of each deserializer."""
+    obj = ModelA(key_name="bench", description="benchmark object")
+    obj.put()
+    data = serializers.serialize("xml", [obj])
+    obj.delete()
+    start = data.index("<entity")
+    end = data.rindex("</django-objects>")
+    key = str(obj.key())
+    data = "".join(
+        [data[:start]] +
+        [data[start:end].replace(key, str(db.Key.from_path(
+            ModelA.kind(), "bench%d" % i)))
+         for i in range(DESERIALIZATION_ENTITIES)] +
+        [data[end:]])
+    for deserializer_class in (xml_serializer.DomDeserializer,
+                               xml_serializer.Deserializer):
+      seconds, peak = measure_deserializer(deserializer_class, data)
+      logging.info(
+          "%s: %d entities in %.1fms (%.0f entities/s), peak memory growth "
+          "%s KB" % (deserializer_class.__name__, DESERIALIZATION_ENTITIES,
+                     seconds * 1000,
+                     DESERIALIZATION_ENTITIES / (seconds or 1e-6), peak))
+
+
+class QueryBenchmark(unittest.TestCase):
+  """Times fetching entities, values and keys."""
+
+  def tearDown(self):
+    db.delete(QueryTestModel.all(keys_only=True).fetch(PROJECTION_ROWS + 100))
+
+  def testProjection(self):
+    """Reports the time and memory used by entities, rows and keys."""
+    QueryTestModel.objects.bulk_create(
+        [QueryTestModel(name="b", number=i) for i in range(PROJECTION_ROWS)])
+    queryset = QueryTestModel.objects.filter(name="b").with_batch_size(500)
+    results = []
+    for label, rows in (("entities", queryset),
+                        ("values_list", queryset.values_list("number")),
+                        ("values", queryset.values("number")),
+                        ("keys", queryset.keys())):
+      start = time.time()
+      rows = list(rows)
+      elapsed = time.time() - start
+      self.assertEqual(PROJECTION_ROWS, len(rows))
+      scale = 10000.0 / PROJECTION_ROWS
+      results.append("%s %.0fms/%.0fKB" % (
+          label, elapsed * 1000 * scale,
+          sum([_approximate_size(r) for r in rows]) * scale / 1024))
+    logging.info("Per 10,000 rows: %s" % ", ".join(results))
+
+
+class ModelManagerBenchmark(unittest.TestCase):
+  """Times the batched get, put and delete methods of the manager."""
+
+  def makeEntities(self, count):
+    return [RegistrationTestModel(key_name="bulk%d" % i) for i in range(count)]
+
+  def testBulk(self):
+    """Reports the time saved by batching compared to looping."""
+    names = ["bulk%d" % i for i in range(BULK_ENTITIES)]
+    start = time.time()
+    for entity in self.makeEntities(BULK_ENTITIES):
+      entity.put()
+    for name in names:
+      RegistrationTestModel.get_by_key_name(name)
+    for name in names:
+      db.delete(db.Key.from_path(RegistrationTestModel.kind(), name))
+    looped = time.time() - start
+    start = time.time()
+    manager = RegistrationTestModel.objects
+    manager.bulk_create(self.makeEntities(BULK_ENTITIES))
+    manager.in_bulk(names, key_names=True)
+    manager.bulk_delete(names, key_names=True)
+    batched = time.time() - start
+    logging.info("Put, get and delete %d entities: looped %.1fms, "
+                 "batched %.1fms" % (BULK_ENTITIES, looped * 1000,
+                                     batched * 1000))
+
+
+class MainBenchmark(unittest.TestCase):
+  """Times the per request setup of the WSGI application in main.py."""
+
+  def testRequestOverhead(self):
+    """Reports the per request time saved by reusing the application."""
+    start = time.time()
+    for i in range(REQUESTS):
+      # What main() previously did for every request.
+      application = WSGIHandler()
+      application.load_middleware()
+    before = (time.time() - start) / REQUESTS
+    start = time.time()
+    for i in range(REQUESTS):
+      # WSGIHandler only loads the middleware on the first request.
+      application = main.application
+      if application._request_middleware is None:
+        application.load_middleware()
+    after = (time.time() - start) / REQUESTS
+    logging.info("Per request setup: new handler %.3fms, reused %.3fms" %
+                 (before * 1000, after * 1000))
+
+
+class StartupBenchmark(unittest.TestCase):
+  """Times eager and lazy installation of the helper."""
+
+  def testStartup(self):
+    """Reports the startup time saved by lazy installation."""
+    eager = min([run_startup(False)[0] for i in range(STARTUP_RUNS)])
+    lazy = min([run_startup(True)[0] for i in range(STARTUP_RUNS)])
+    logging.info("Helper startup: eager %.1fms, lazy %.1fms, saved %.1fms" %
+                 (eager * 1000, lazy * 1000, (eager - lazy) * 1000))
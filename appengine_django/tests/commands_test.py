@@ -36,10 +36,12 @@ import sys
 from django.db.models import get_models
 
 from google.appengine.ext import db
+from appengine_django.management.commands import dumpdata
 from appengine_django.models import BaseModel
 from appengine_django.models import ModelManager
 from appengine_django.models import ModelOptions
 from appengine_django.models import RegistrationTestModel
+from appengine_django.query import QuerySet
 
 
 class CommandsTest(unittest.TestCase):
@@ -170,6 +172,10 @@ class CommandsTest(unittest.TestCase):
     """Tests the shell command."""
     self.assertCommandSucceeds("shell", input="exit")
 
+  def testStartupProfile(self):
+    """Tests the startup_profile command."""
+    self.assertCommandSucceeds("startup_profile", ["--runs", "1"])
+
   def testUpdate(self):
     """Tests that the update command exists.
 
@@ -184,3 +190,21 @@ class CommandsTest(unittest.TestCase):
     cmd_list = self.getCommands()
     self.assert_("__init__" not in cmd_list)
     self.assert_("base" not in cmd_list)
+
+
+class DumpDataTest(unittest.TestCase):
+  """Tests selecting the entities dumped by the dumpdata command."""
+
+  def testModelManager(self):
+    """Tests that ModelManager models are dumped using a batched QuerySet."""
+    objects = dumpdata.get_dump_objects(RegistrationTestModel, 10)
+    self.assert_(isinstance(objects, QuerySet))
+
+  def testOtherManager(self):
+    """Tests that models with other managers are dumped using all()."""
+    class Manager(object):
+      def all(self):
+        return ["entity"]
+    class Model(object):
+      _default_manager = Manager()
+    self.assertEqual(["entity"], dumpdata.get_dump_objects(Model, 10))
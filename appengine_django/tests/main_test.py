@@ -0,0 +1,47 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the WSGI application created by main.py."""
+
+
+import unittest
+from StringIO import StringIO
+
+from django.core.handlers.wsgi import WSGIHandler
+
+import main
+
+
+class MainTest(unittest.TestCase):
+  """Tests that main.py reuses one WSGI application for every request."""
+
+  def testApplicationCreatedOnce(self):
+    """Tests that the application is created when main.py is imported."""
+    self.assert_(isinstance(main.application, WSGIHandler))
+
+  def testMiddlewareLoadedOnce(self):
+    """Tests that every request reuses the application's middleware."""
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/_main_test_missing",
+               "SERVER_NAME": "localhost", "SERVER_PORT": "80",
+               "wsgi.url_scheme": "http"}
+    start_response = lambda status, headers: None
+    main.application(dict(environ, **{"wsgi.input": StringIO()}),
+                     start_response)
+    middleware = main.application._request_middleware
+    self.assert_(middleware is not None)
+    main.application(dict(environ, **{"wsgi.input": StringIO()}),
+                     start_response)
+    self.assert_(main.application._request_middleware is middleware)
@@ -23,9 +23,12 @@ from django import VERSION
 from django.db.models import get_models
 from django import forms
 
+from google.appengine.api import memcache
 from google.appengine.ext.db import djangoforms
 from google.appengine.ext import db
 
+from appengine_django import entitycache
+from appengine_django import models
 from appengine_django.models import BaseModel
 from appengine_django.models import ModelManager
 from appengine_django.models import ModelOptions
@@ -39,6 +42,19 @@ class TestModelWithProperties(BaseModel):
   property3 = db.Reference()
 
 
+class TestModelWithDates(TestModelWithProperties):
+  """Test model class inheriting properties from another model."""
+  date = db.DateProperty()
+  time = db.TimeProperty()
+  datetime = db.DateTimeProperty()
+
+
+class CachedTestModel(BaseModel):
+  """Test model class with the entity cache enabled."""
+  cache_entities = True
+  value = db.IntegerProperty()
+
+
 class ModelTest(unittest.TestCase):
   """Unit tests for the combined model class."""
 
@@ -77,6 +93,30 @@ class ModelTest(unittest.TestCase):
         # 'key_name' for appengine models.
         self.assertEqual("key_name", field.rel.field_name)
 
+  def testFieldMetadata(self):
+    """Tests the field metadata computed when the model is created."""
+    meta = TestModelWithDates._meta
+    self.assertEqual(sorted(TestModelWithDates.properties()),
+                     sorted(meta.field_map))
+    self.assertEqual({"property1": models.FIELD_OTHER,
+                      "property2": models.FIELD_OTHER,
+                      "property3": models.FIELD_REFERENCE,
+                      "date": models.FIELD_DATE,
+                      "time": models.FIELD_TIME,
+                      "datetime": models.FIELD_DATETIME}, meta.field_kinds)
+    self.assert_(meta.get_field("date") is TestModelWithDates.date)
+    self.assertRaises(models.FieldDoesNotExist, meta.get_field, "missing")
+    obj = TestModelWithDates(property2=2)
+    self.assertEqual(2, meta.value_getters["property2"](obj))
+
+  def testInheritedPropertiesWrappedOnce(self):
+    """Tests that properties shared with a parent model keep their wrapper."""
+    field = TestModelWithProperties._meta.get_field("property1")
+    self.assert_(field is TestModelWithDates._meta.get_field("property1"))
+    value_to_string = field.value_to_string
+    self.assert_(models.PropertyWrapper(field) is field)
+    self.assert_(field.value_to_string is value_to_string)
+
   def testDjangoModelOptionsStub(self):
     """Tests that the options stub has the required properties by Django."""
     # Django requires object_name and app_label for serialization output.
@@ -105,6 +145,168 @@ class ModelTest(unittest.TestCase):
     new_obj = RegistrationTestModel.get(pk)
     self.assertEqual(obj.key(), new_obj.key())
 
+  def testEqualityAndHashing(self):
+    """Tests that entities are equal and hash alike when their keys match."""
+    first = RegistrationTestModel(key_name="same")
+    second = RegistrationTestModel(key_name="same")
+    other = RegistrationTestModel(key_name="other")
+    self.assertEqual(first, second)
+    self.assertNotEqual(first, other)
+    self.assertEqual(hash(first), hash(second))
+    self.assertEqual(2, len(set([first, second, other])))
+    self.assertEqual(first._get_pk_val(), second._get_pk_val())
+
+  def testKeyChangeResetsCache(self):
+    """Tests that the cached key values are reset when an entity is saved."""
+    first = RegistrationTestModel()
+    second = RegistrationTestModel()
+    self.assertNotEqual(first, second)
+    self.assertEqual(first, first)
+    key = first.put()
+    self.assertEqual(unicode(key), first._get_pk_val())
+    self.assertEqual(first, RegistrationTestModel.get(key))
+    self.assertEqual(hash(first), hash(RegistrationTestModel.get(key)))
+    first.delete()
+
   def testModelFormPatched(self):
     """Tests that the Django ModelForm is being successfully patched."""
     self.assertEqual(djangoforms.ModelForm, forms.ModelForm)
+
+
+class ModelManagerBulkTest(unittest.TestCase):
+  """Tests the batched get, put and delete methods of the manager."""
+
+  def tearDown(self):
+    db.delete(RegistrationTestModel.all(keys_only=True).fetch(1000))
+
+  def makeEntities(self, count):
+    return [RegistrationTestModel(key_name="bulk%d" % i) for i in range(count)]
+
+  def testBulkCreate(self):
+    """Tests that entities are saved in batches."""
+    keys = RegistrationTestModel.objects.bulk_create(self.makeEntities(5),
+                                                     batch_size=2)
+    self.assertEqual(5, len(keys))
+    self.assertEqual(5, RegistrationTestModel.all().count())
+
+  def testInBulk(self):
+    """Tests that entities are fetched by primary key and by key name."""
+    keys = RegistrationTestModel.objects.bulk_create(self.makeEntities(3))
+    pks = [unicode(k) for k in keys] + [unicode(
+        db.Key.from_path(RegistrationTestModel.kind(), "missing"))]
+    found = RegistrationTestModel.objects.in_bulk(pks, batch_size=2)
+    self.assertEqual(sorted(pks[:3]), sorted(found.keys()))
+    self.assertEqual(keys[0], found[pks[0]].key())
+    found = RegistrationTestModel.objects.in_bulk(["bulk1", "missing"],
+                                                  key_names=True)
+    self.assertEqual(["bulk1"], found.keys())
+
+  def testBulkDelete(self):
+    """Tests that entities, keys and key names can be deleted."""
+    entities = self.makeEntities(4)
+    RegistrationTestModel.objects.bulk_create(entities)
+    RegistrationTestModel.objects.bulk_delete(entities[:2], batch_size=1)
+    RegistrationTestModel.objects.bulk_delete(["bulk2"], key_names=True)
+    self.assertEqual(["bulk3"], [e.key().name() for e in
+                                 RegistrationTestModel.all()])
+
+
+class EntityCacheTest(unittest.TestCase):
+  """Tests the read-through entity cache."""
+
+  def setUp(self):
+    # Simulate a request, during which the local cache is used.
+    entitycache.clear_local_cache()
+    # Also removes the invalidation locks left by earlier tests.
+    memcache.flush_all()
+    for name in entitycache.stats:
+      entitycache.stats[name] = 0
+
+  def tearDown(self):
+    entitycache.release_local_cache()
+    db.delete(CachedTestModel.all(keys_only=True).fetch(100))
+
+  def testReadThrough(self):
+    """Tests that entities are read from each tier in turn."""
+    # Saved with db.put, so that the entity is not locked out of memcache.
+    db.put(CachedTestModel(key_name="one", value=1))
+    self.assertEqual(1, CachedTestModel.get_by_key_name("one").value)
+    self.assertEqual(1, entitycache.stats["misses"])
+    self.assertEqual(1, CachedTestModel.get_by_key_name("one").value)
+    self.assertEqual(1, entitycache.stats["local_hits"])
+    entitycache.clear_local_cache()
+    self.assertEqual(1, CachedTestModel.get_by_key_name("one").value)
+    self.assertEqual(1, entitycache.stats["memcache_hits"])
+
+  def testInvalidation(self):
+    """Tests that put and delete remove entities from the cache."""
+    entity = CachedTestModel(key_name="one", value=1)
+    entity.put()
+    CachedTestModel.get_by_key_name("one")
+    entity.value = 2
+    entity.put()
+    self.assertEqual(2, CachedTestModel.get_by_key_name("one").value)
+    entity.delete()
+    self.assertEqual(None, CachedTestModel.get_by_key_name("one"))
+    self.assertEqual(3, entitycache.stats["misses"])
+
+  def testCachedMissInvalidation(self):
+    """Tests that saving any instance with a key replaces a cached miss."""
+    self.assertEqual(None, CachedTestModel.get_by_key_name("one"))
+    CachedTestModel(key_name="one", value=1).put()
+    self.assertEqual(1, CachedTestModel.get_by_key_name("one").value)
+    self.assertEqual(2, entitycache.stats["misses"])
+
+  def testReadsReturnCopies(self):
+    """Tests that unsaved changes to an entity are not seen by other reads."""
+    db.put(CachedTestModel(key_name="one", value=1))
+    entity = CachedTestModel.get_by_key_name("one")
+    entity.value = 2
+    other = CachedTestModel.get_by_key_name("one")
+    self.assertEqual(1, other.value)
+    self.failIf(other is entity)
+    other.value = 3
+    self.assertEqual(1, CachedTestModel.get_by_key_name("one").value)
+    self.assertEqual(2, entitycache.stats["local_hits"])
+
+  def testInvalidationLock(self):
+    """Tests that entities read just after being written are not stored."""
+    entity = CachedTestModel(key_name="one", value=1)
+    entity.put()
+    CachedTestModel.get_by_key_name("one")
+    entitycache.clear_local_cache()
+    CachedTestModel.get_by_key_name("one")
+    self.assertEqual(0, entitycache.stats["memcache_hits"])
+    self.assertEqual(2, entitycache.stats["misses"])
+
+  def testOutsideRequest(self):
+    """Tests that only memcache is used outside of a request."""
+    db.put(CachedTestModel(key_name="one", value=1))
+    entitycache.release_local_cache()
+    CachedTestModel.get_by_key_name("one")
+    CachedTestModel.get_by_key_name("one")
+    self.assertEqual({"local_hits": 0, "memcache_hits": 1, "misses": 1},
+                     entitycache.stats)
+
+  def testTransaction(self):
+    """Tests that reads inside a transaction bypass the cache."""
+    db.put(CachedTestModel(key_name="one", value=1))
+    CachedTestModel.get_by_key_name("one")
+    entity = db.run_in_transaction(CachedTestModel.get_by_key_name, "one")
+    self.assertEqual(1, entity.value)
+    self.assertEqual({"local_hits": 0, "memcache_hits": 0, "misses": 1},
+                     entitycache.stats)
+
+  def testMultipleKeys(self):
+    """Tests that multiple keys are fetched together from each tier."""
+    keys = db.put(
+        [CachedTestModel(key_name=str(i), value=i) for i in range(3)])
+    CachedTestModel.get(keys[:2])
+    entitycache.clear_local_cache()
+    CachedTestModel.get(keys[0])
+    entities = CachedTestModel.get([str(k) for k in keys] + [
+        db.Key.from_path(CachedTestModel.kind(), "missing")])
+    self.assertEqual([0, 1, 2, None],
+                     [e and e.value for e in entities])
+    self.assertEqual({"local_hits": 1, "memcache_hits": 2, "misses": 4},
+                     entitycache.stats)
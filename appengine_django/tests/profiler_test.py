@@ -0,0 +1,77 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests that the RPC profiler records the API calls made."""
+
+
+import unittest
+
+from django import http
+from django.conf import settings
+
+from google.appengine.api import memcache
+
+from appengine_django import profiler
+from appengine_django.models import RegistrationTestModel
+
+
+class RPCProfilerTest(unittest.TestCase):
+  """Unit tests for the RPC profiler."""
+
+  def tearDown(self):
+    profiler.stop_profile()
+    for name in ("RPC_BUDGET", "RPC_BUDGET_STRICT", "RPC_PROFILE_HEADER"):
+      if hasattr(settings, name):
+        delattr(settings, name)
+
+  def testCountsCalls(self):
+    """Tests that calls to the development stubs are counted."""
+    profile = profiler.start_profile()
+    obj = RegistrationTestModel(key_name="profiled")
+    obj.put()
+    RegistrationTestModel.get_by_key_name("profiled")
+    memcache.get("profiled")
+    self.assert_(profile is profiler.stop_profile())
+    self.assertEqual(2, profile.count("datastore_v3"))
+    self.assertEqual(1, profile.count("memcache"))
+    self.assertEqual(1, profile.calls[("datastore_v3", "Put")][0])
+    self.assert_(profile.calls[("datastore_v3", "Put")][1] > 0)
+    self.assert_("datastore_v3.Get=1/" in profile.summary())
+
+  def testNoProfileActive(self):
+    """Tests that calls made without an active profile are ignored."""
+    profile = profiler.start_profile()
+    profiler.stop_profile()
+    memcache.get("profiled")
+    self.assertEqual(0, profile.count())
+
+  def testMiddleware(self):
+    """Tests that the middleware reports and enforces the budget."""
+    settings.RPC_PROFILE_HEADER = True
+    settings.RPC_BUDGET = {"memcache": 1}
+    settings.RPC_BUDGET_STRICT = True
+    middleware = profiler.RPCProfileMiddleware()
+    request = http.HttpRequest()
+    middleware.process_request(request)
+    memcache.get("profiled")
+    response = middleware.process_response(request, http.HttpResponse())
+    self.assert_("memcache.Get=1/" in response[profiler.HEADER_NAME])
+    middleware.process_request(request)
+    memcache.get("profiled")
+    memcache.get("profiled")
+    self.assertRaises(profiler.RPCBudgetExceeded,
+                      middleware.process_response, request,
+                      http.HttpResponse())
@@ -0,0 +1,168 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the Django style QuerySet returned by the model manager."""
+
+
+import unittest
+
+from google.appengine.ext import db
+
+from django.core.exceptions import MultipleObjectsReturned
+
+from appengine_django.models import BaseModel
+from appengine_django.query import QuerySet
+
+
+class QueryTestModel(BaseModel):
+  """Model queried by the tests."""
+  name = db.StringProperty()
+  number = db.IntegerProperty()
+
+
+class QuerySetTest(unittest.TestCase):
+  """Tests filtering, ordering, slicing and iterating a QuerySet."""
+
+  def setUp(self):
+    QueryTestModel.objects.bulk_create(
+        [QueryTestModel(key_name="q%d" % i, name="n%d" % (i % 2), number=i)
+         for i in range(10)])
+
+  def tearDown(self):
+    db.delete(QueryTestModel.all(keys_only=True).fetch(100))
+
+  def numbers(self, queryset):
+    return [e.number for e in queryset]
+
+  def testLazy(self):
+    """Tests that the manager returns an unevaluated QuerySet."""
+    queryset = QueryTestModel.objects.filter(number__gte=5)
+    self.assert_(isinstance(queryset, QuerySet))
+    QueryTestModel(key_name="q10", number=10).put()
+    self.assertEqual([5, 6, 7, 8, 9, 10], self.numbers(queryset))
+
+  def testFilterAndOrder(self):
+    """Tests Django style lookups and ordering."""
+    queryset = QueryTestModel.objects.filter(name="n1", number__lt=7)
+    self.assertEqual([5, 3, 1],
+                     self.numbers(queryset.order_by("-number")))
+    self.assertEqual([2, 4], self.numbers(
+        QueryTestModel.objects.filter(number__in=[2, 4, 11])
+        .order_by("number")))
+    self.assertEqual([0, 1, 2], self.numbers(
+        QueryTestModel.objects.exclude(number__in=[3, 4])
+        .order_by("number")[:3]))
+    self.assertEqual([8], self.numbers(
+        QueryTestModel.objects.filter("number >", 7).filter(name="n0")))
+
+  def testSlicing(self):
+    """Tests that slices are applied to the query and can be chained."""
+    queryset = QueryTestModel.objects.order_by("number")
+    self.assertEqual([2, 3, 4, 5], self.numbers(queryset[2:6]))
+    self.assertEqual([3, 4], self.numbers(queryset[2:6][1:3]))
+    self.assertEqual(7, queryset[7].number)
+    self.assertRaises(IndexError, queryset.__getitem__, 10)
+
+  def testBatchedIteration(self):
+    """Tests iterating in batches smaller than the result."""
+    queryset = QueryTestModel.objects.order_by("number").with_batch_size(3)
+    self.assertEqual(range(10), self.numbers(queryset))
+    self.assertEqual(range(1, 9), self.numbers(queryset[1:9]))
+    # IN queries cannot use cursors so are fetched using offsets.
+    self.assertEqual([1, 3, 5, 7, 9], self.numbers(
+        queryset.filter(number__in=[1, 3, 5, 7, 9])))
+
+  def testCount(self):
+    """Tests counting with and without limits and slices."""
+    self.assertEqual(10, QueryTestModel.objects.count())
+    self.assertEqual(4, QueryTestModel.objects.count(limit=4))
+    self.assertEqual(5, QueryTestModel.objects.filter(name="n0").count())
+    self.assertEqual(3, QueryTestModel.objects.get_query_set()[7:20].count())
+    self.failIf(QueryTestModel.objects.filter(number=20))
+
+  def testGet(self):
+    """Tests getting single entities by lookup and by key."""
+    entity = QueryTestModel.objects.get(number=3)
+    self.assertEqual("q3", entity.key().name())
+    self.assertEqual(entity.key(), QueryTestModel.objects.get(
+        entity.key()).key())
+    self.assertRaises(QueryTestModel.DoesNotExist, QueryTestModel.objects.get,
+                      number=20)
+    self.assertRaises(MultipleObjectsReturned, QueryTestModel.objects.get,
+                      name="n0")
+
+  def testQueryCompatibility(self):
+    """Tests that all and get without arguments behave as with db.Query."""
+    query = QueryTestModel.objects.all()
+    self.assert_(isinstance(query, db.Query))
+    self.assertEqual(3, query.filter("number <", 3).count())
+    self.assert_(isinstance(QueryTestModel.objects.get(), QueryTestModel))
+    db.delete(QueryTestModel.all(keys_only=True).fetch(100))
+    self.assertEqual(None, QueryTestModel.objects.get())
+
+  def testFilterArguments(self):
+    """Tests that positional filters need a property and a value."""
+    self.assertRaises(TypeError, QueryTestModel.objects.filter, "number =",
+                      1, 2)
+
+
+class ProjectionTest(unittest.TestCase):
+  """Tests fetching keys and property values without model instances."""
+
+  def setUp(self):
+    self.keys = QueryTestModel.objects.bulk_create(
+        [QueryTestModel(key_name="p%d" % i, name="n%d" % i, number=i)
+         for i in range(3)])
+
+  def tearDown(self):
+    db.delete(QueryTestModel.all(keys_only=True).fetch(100))
+
+  def testKeys(self):
+    """Tests fetching only keys."""
+    self.assertEqual(self.keys,
+                     list(QueryTestModel.objects.order_by("number").keys()))
+
+  def testValues(self):
+    """Tests fetching dictionaries of values."""
+    rows = list(QueryTestModel.objects.order_by("number").values(
+        "key_name", "number"))
+    self.assertEqual({"key_name": "p0", "number": 0}, rows[0])
+    self.assertEqual(3, len(rows))
+    self.assertEqual(["name", "number", "pk"], sorted(
+        QueryTestModel.objects.values()[0].keys()))
+
+  def testValuesBatches(self):
+    """Tests fetching values over several batches of raw entities."""
+    self.assertEqual(["n0", "n1", "n2"], list(
+        QueryTestModel.objects.order_by("number").with_batch_size(2)
+        .values_list("name", flat=True)))
+
+  def testValuesKeys(self):
+    """Tests that keys() of a values query returns the keys."""
+    self.assertEqual(self.keys, list(
+        QueryTestModel.objects.order_by("number").values("name").keys()))
+
+  def testValuesList(self):
+    """Tests fetching rows and flat lists of values."""
+    rows = list(QueryTestModel.objects.filter(number__gte=1).values_list(
+        "pk", "name"))
+    self.assertEqual([(self.keys[1], "n1"), (self.keys[2], "n2")], rows)
+    self.assertEqual("n1", rows[0].name)
+    self.failIf(hasattr(rows[0], "__dict__"))
+    self.assertEqual(["p0", "p1", "p2"], list(
+        QueryTestModel.objects.values_list("key_name", flat=True)))
+    self.assertEqual(1, QueryTestModel.objects.values_list(
+        "number", flat=True).get(name="n1"))
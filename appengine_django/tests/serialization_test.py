@@ -22,6 +22,7 @@ and Django models can be dumped and loaded to all of the provided formats.
 """
 
 
+import datetime
 import os
 import re
 import unittest
@@ -30,7 +31,11 @@ from StringIO import StringIO
 from django.core import serializers
 
 from google.appengine.ext import db
+from appengine_django import bulkload
 from appengine_django.models import BaseModel
+from appengine_django.serializer import python as python_serializer
+from appengine_django.serializer import streaming
+from appengine_django.serializer import xml as xml_serializer
 
 
 class ModelA(BaseModel):
@@ -321,6 +326,210 @@ class SerializationTest(unittest.TestCase):
     obj.put()
     self.doSerialisationTest(format, obj)
 
+  def runDateTimeMicrosecondsTest(self, format):
+    """Tests that microseconds below 100000 survive a round trip."""
+    obj = ModelC(dt_value=datetime.datetime(2008, 5, 13, 1, 2, 3, 5000),
+                 t_value=datetime.time(1, 2, 3, 5000))
+    obj.put()
+    self.doSerialisationTest(format, obj)
+
+  def runStreamingTest(self, format):
+    """Tests that objects serialized one at a time can be loaded OK."""
+    stream = StringIO()
+    streaming.serialize(format, ModelA.objects.filter(description="none"),
+                        stream)
+    self.assertEqual([], list(serializers.deserialize(
+        format, StringIO(stream.getvalue()))))
+    objects = [ModelA(key_name="stream%d" % i, description="streamed")
+               for i in range(3)]
+    db.put(objects)
+    stream = StringIO()
+    streaming.serialize(format, ModelA.objects.filter(
+        description="streamed").with_batch_size(2), stream, indent=2)
+    result = list(serializers.deserialize(format,
+                                          StringIO(stream.getvalue())))
+    db.delete(objects)
+    self.assertEqual(3, len(result))
+    for orig, new in zip(objects, result):
+      self.compareObjects(orig, new.object, format)
+
+  def runBulkLoadTest(self, format):
+    """Tests that objects saved by a bulk loader are saved in batches."""
+    parent = ModelA(description="parent object", key_name="bulkparent")
+    parent.put()
+    objects = [ModelA(key_name="bulk%d" % i, description="bulk", parent=parent)
+               for i in range(5)]
+    db.put(objects)
+    stream = StringIO()
+    serializers.serialize(format, objects, stream=stream)
+    db.delete(objects)
+    loader = bulkload.start(batch_size=2, max_in_flight=2)
+    try:
+      for obj in serializers.deserialize(format,
+                                         StringIO(stream.getvalue())):
+        obj.save()
+      # The last object is buffered until the loader is finished.
+      self.assertEqual(None, db.get(objects[-1].key()))
+    finally:
+      bulkload.finish()
+    self.assertEqual(None, bulkload.active_loader)
+    self.assertEqual(5, loader.count)
+    self.assertEqual(3, loader.puts)
+    loaded = db.get([obj.key() for obj in objects])
+    for orig, new in zip(objects, loaded):
+      self.compareObjects(orig, new, format)
+    db.delete(objects + [parent])
+
+
+class XmlDeserializerTest(unittest.TestCase):
+  """Compares the incremental and minidom based XML deserializers."""
+
+  def compareDeserialized(self, dom, new):
+    self.assertEqual(dom.object.__class__, new.object.__class__)
+    self.assertEqual(dom.object.key().name(), new.object.key().name())
+    if dom.object._parent is None:
+      self.assertEqual(None, new.object._parent)
+    else:
+      self.assertEqual(dom.object._parent._entity, new.object._parent._entity)
+    for name, prop in dom.object.properties().items():
+      self.assertEqual(prop.get_value_for_datastore(dom.object),
+                       prop.get_value_for_datastore(new.object))
+    self.assertEqual(dom.m2m_data, new.m2m_data)
+
+  def testSameObjects(self):
+    """Tests that both deserializers produce the same objects."""
+    parent = ModelA(key_name="xmlparent", description=u"caf\xe9 <&>")
+    child = ModelA(key_name="xmlchild", description="child", parent=parent)
+    friend = ModelB(key_name="xmlfriend", description="friend", friend=parent)
+    dates = ModelC(key_name="xmldates")
+    objects = [parent, child, friend, dates]
+    db.put(objects)
+    data = serializers.serialize("xml", objects)
+    db.delete(objects)
+    dom = list(xml_serializer.DomDeserializer(data))
+    new = list(xml_serializer.Deserializer(StringIO(data)))
+    self.assertEqual(4, len(new))
+    for dom_object, new_object in zip(dom, new):
+      self.compareDeserialized(dom_object, new_object)
+
+  def testNoObjects(self):
+    data = serializers.serialize("xml", [])
+    self.assertEqual([], list(xml_serializer.Deserializer(data)))
+
+  def testInvalidModel(self):
+    data = serializers.serialize("xml", []).replace(
+        "</django-objects>",
+        """<entity kind="tests.missing" key="x"></entity></django-objects>""")
+    self.assertRaises(serializers.base.DeserializationError, list,
+                      xml_serializer.Deserializer(data))
+
+
+class PythonDeserializerTest(unittest.TestCase):
+  """Tests the converters and date parsing of the python deserializer."""
+
+  def testParseDatetime(self):
+    parse = python_serializer.parse_datetime
+    self.assertEqual(datetime.datetime(2008, 5, 13, 1, 2, 3),
+                     parse("2008-05-13 01:02:03"))
+    self.assertEqual(datetime.datetime(2008, 5, 13, 1, 2, 3, 4),
+                     parse(u"2008-05-13 01:02:03.000004"))
+    self.assertEqual(datetime.datetime(2008, 5, 13, 1, 2, 3, 5000),
+                     parse("2008-05-13 01:02:03.5000"))
+    self.assertRaises(ValueError, parse, "2008-05-13")
+    self.assertRaises(ValueError, parse, "2008-05-13 01:02:03.")
+    self.assertRaises(ValueError, parse, "2008-13-13 01:02:03")
+
+  def testParseDateAndTime(self):
+    self.assertEqual(datetime.date(2008, 5, 13),
+                     python_serializer.parse_date("2008-05-13"))
+    self.assertRaises(ValueError, python_serializer.parse_date, "13/05/2008")
+    self.assertEqual(datetime.time(1, 2, 3),
+                     python_serializer.parse_time("01:02:03"))
+    self.assertEqual(datetime.time(1, 2, 3, 123456),
+                     python_serializer.parse_time("01:02:03.123456"))
+    self.assertRaises(ValueError, python_serializer.parse_time, "01:02")
+
+  def testParseMicrosecondsFallback(self):
+    """Tests that the strptime fallback agrees with the direct parsers."""
+    parse = python_serializer.parse_datetime_with_microseconds
+    self.assertEqual(python_serializer.parse_datetime("2008-05-13 01:02:03.5"),
+                     parse("2008-05-13 01:02:03.5", "%Y-%m-%d %H:%M:%S"))
+    self.assertEqual(python_serializer.parse_time("01:02:03.12"),
+                     parse("01:02:03.12", "%H:%M:%S").time())
+    self.assertEqual(datetime.time(1, 2, 3, 5000),
+                     python_serializer.parse_time("1:02:03.5000"))
+    self.assertRaises(ValueError, parse, "01:02:03.1234567", "%H:%M:%S")
+
+  def testConverters(self):
+    """Tests that converters are created once and convert each kind."""
+    converters = python_serializer.get_converters(ModelC)
+    self.assert_(converters is python_serializer.get_converters(ModelC))
+    name, convert = converters["dt_value"]
+    self.assertEqual("dt_value", name)
+    self.assertEqual(datetime.datetime(2008, 5, 13, 1, 2, 3),
+                     convert("2008-05-13 01:02:03"))
+    name, convert = converters["t_value"]
+    self.assertEqual(datetime.time(1, 2, 3),
+                     convert(datetime.datetime(1970, 1, 1, 1, 2, 3)))
+    name, convert = python_serializer.get_converters(ModelB)["friend"]
+    self.assertEqual(db.Key.from_path("ModelA", "test"),
+                     convert(["ModelA", "test"]))
+
+  def testParseKeyRepr(self):
+    """Tests that the repr of keys are parsed back to the same keys."""
+    parent = db.Key.from_path("ModelA", u"caf\xe9 'quoted'")
+    for key in (parent, db.Key.from_path("ModelB", 42, parent=parent),
+                db.Key.from_path("ModelB", "child", parent=parent)):
+      self.assertEqual(key, python_serializer.parse_key_repr(repr(key)))
+    self.assertEqual(db.Key.from_path("ModelA", "test"),
+                     python_serializer.parse_key_repr(
+                         'db.Key.from_path("ModelA", "test")'))
+
+  def testParseKeyReprRejectsExpressions(self):
+    for key_repr in ("Key.from_path('ModelA', 'test') or open('x')",
+                     "Key.from_path('ModelA', open('x'))",
+                     "Key.from_path('ModelA', 'test', parent=None)",
+                     "Key.from_path(_app='x', 'ModelA', 'test')"):
+      self.assertRaises(serializers.base.DeserializationError,
+                        python_serializer.parse_key_repr, key_repr)
+
+  def testResolveKeyCached(self):
+    """Tests that keys resolved from strings are cached."""
+    key = db.Key.from_path("ModelA", "cached")
+    for key_data in (str(key), repr(key), "cached"):
+      resolved = python_serializer.resolve_key("ModelA", key_data)
+      self.assertEqual(key, resolved)
+      self.assert_(resolved is
+                   python_serializer.resolve_key("ModelA", key_data))
+    self.assertEqual(db.Key.from_path("ModelB", "cached"),
+                     python_serializer.resolve_key("ModelB", "cached"))
+
+  def testLRUCache(self):
+    cache = python_serializer.LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    self.assertEqual(1, cache.get("a"))
+    cache.set("c", 3)
+    self.assertEqual(2, len(cache))
+    self.assertEqual(None, cache.get("b"))
+    self.assertEqual(1, cache.get("a"))
+    self.assertEqual(3, cache.get("c"))
+
+  def testDeserialize(self):
+    """Tests deserializing objects using the converters."""
+    objects = [{"model": "tests.modelc", "pk": "dates%d" % i,
+                "fields": {"dt_value": "2008-05-13 01:02:03.%06d" % i,
+                           "d_value": "2008-05-13",
+                           "t_value": "01:02:03"}}
+               for i in range(2)]
+    result = list(python_serializer.Deserializer(objects))
+    self.assertEqual(2, len(result))
+    self.assertEqual("dates1", result[1].object.key().name())
+    self.assertEqual(datetime.datetime(2008, 5, 13, 1, 2, 3, 1),
+                     result[1].object.dt_value)
+    self.assertEqual(datetime.date(2008, 5, 13), result[1].object.d_value)
+    self.assertEqual(datetime.time(1, 2, 3), result[1].object.t_value)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,340 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests that the App Engine session backends function correctly."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+
+from google.appengine.api import memcache
+
+from appengine_django.management.commands import cleanup_sessions
+from appengine_django.sessions.backends import cached_db
+from appengine_django.sessions.backends import db
+from appengine_django.sessions.backends import signed_cookies
+from appengine_django.sessions import codec
+from appengine_django.sessions.layouts import get_key_layout
+from appengine_django.sessions.models import Session
+
+
+class DatastoreSessionTest(unittest.TestCase):
+  """Tests the datastore backed session store."""
+
+  def testSaveAndLoad(self):
+    """Tests that session data survives a round trip through the datastore."""
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    new_store = db.SessionStore(store.session_key)
+    self.assertEqual("bar", new_store["foo"])
+
+  def testDelete(self):
+    """Tests that a deleted session no longer exists."""
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    self.assert_(store.exists(store.session_key))
+    store.delete()
+    self.failIf(store.exists(store.session_key))
+
+  def testUnchangedSaveSkipped(self):
+    """Tests that saving an unchanged session does not write the entity."""
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    new_store = db.SessionStore(store.session_key)
+    new_store["foo"]
+    skipped = db.write_counts["skipped"]
+    performed = db.write_counts["performed"]
+    new_store.save()
+    self.assertEqual(skipped + 1, db.write_counts["skipped"])
+    self.assertEqual(performed, db.write_counts["performed"])
+    # A real modification must always be written.
+    new_store["foo"] = "baz"
+    new_store.save()
+    self.assertEqual(performed + 1, db.write_counts["performed"])
+    self.assertEqual("baz", db.SessionStore(store.session_key)["foo"])
+
+
+class CachedSessionTest(unittest.TestCase):
+  """Tests the memcache fronted session store."""
+
+  def setUp(self):
+    memcache.flush_all()
+
+  def testLoadFromCache(self):
+    """Tests that sessions are served from memcache."""
+    store = cached_db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    # Remove the durable copy; the cached copy must still be found.
+    Session.get_by_key_name("k:" + store.session_key).delete()
+    new_store = cached_db.SessionStore(store.session_key)
+    self.assertEqual("bar", new_store["foo"])
+
+  def testLoadFromDatastore(self):
+    """Tests that evicted sessions are reloaded from the datastore."""
+    store = cached_db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    memcache.flush_all()
+    new_store = cached_db.SessionStore(store.session_key)
+    self.assertEqual("bar", new_store["foo"])
+
+  def testUnmodifiedSaveSkipsDatastore(self):
+    """Tests that saving an unchanged session does not write the entity."""
+    store = cached_db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    Session.get_by_key_name("k:" + store.session_key).delete()
+    new_store = cached_db.SessionStore(store.session_key)
+    new_store["foo"]
+    new_store.save()
+    self.assertEqual(None, Session.get_by_key_name("k:" + store.session_key))
+
+  def testModifiedSaveWritesDatastore(self):
+    """Tests that modified sessions are written through to the datastore."""
+    store = cached_db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    new_store = cached_db.SessionStore(store.session_key)
+    new_store["foo"] = "baz"
+    new_store.save()
+    memcache.flush_all()
+    self.assertEqual("baz", cached_db.SessionStore(store.session_key)["foo"])
+
+  def testSkippedWriteKeepsFlushTime(self):
+    """Tests that a skipped datastore write does not count as a flush."""
+    old_interval = getattr(settings, "SESSION_FLUSH_INTERVAL", None)
+    settings.SESSION_FLUSH_INTERVAL = 0
+    try:
+      store = cached_db.SessionStore()
+      store["foo"] = "bar"
+      store.save()
+      flushed = store._cache_entry[2]
+      skipped = db.write_counts["skipped"]
+      store.save()
+      self.assertEqual(skipped + 1, db.write_counts["skipped"])
+      self.assertEqual(flushed, store._cache_entry[2])
+    finally:
+      if old_interval is None:
+        del settings.SESSION_FLUSH_INTERVAL
+      else:
+        settings.SESSION_FLUSH_INTERVAL = old_interval
+
+  def testDelete(self):
+    """Tests that deleting a session removes the cached and durable copies."""
+    store = cached_db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    store.delete()
+    self.failIf(store.exists(store.session_key))
+    self.assertEqual(None, Session.get_by_key_name("k:" + store.session_key))
+
+
+class SignedCookieSessionTest(unittest.TestCase):
+  """Tests the signed cookie session store."""
+
+  def testSaveAndLoad(self):
+    """Tests that session data round trips through the cookie value."""
+    store = signed_cookies.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    new_store = signed_cookies.SessionStore(store.session_key)
+    self.assertEqual("bar", new_store["foo"])
+
+  def testTamperedCookie(self):
+    """Tests that a tampered cookie results in an empty session."""
+    store = signed_cookies.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    cookie = store.session_key
+    tampered = cookie[:-1] + (cookie[-1] == "0" and "1" or "0")
+    new_store = signed_cookies.SessionStore(tampered)
+    self.failIf("foo" in new_store)
+    self.assert_(new_store.modified)
+
+  def testMalformedCookie(self):
+    """Tests that garbage cookie values are rejected."""
+    new_store = signed_cookies.SessionStore("not:a:valid:cookie")
+    self.failIf("foo" in new_store)
+
+  def testLargeSessionFallsBackToDatastore(self):
+    """Tests that oversized sessions are kept in the datastore."""
+    settings.SESSION_COOKIE_MAX_SIZE = 16
+    try:
+      store = signed_cookies.SessionStore()
+      store["foo"] = "x" * 1024
+      store.save()
+      key = store.session_key
+      self.failIf(signed_cookies.SEPARATOR in key)
+      self.assert_(Session.get_by_key_name("k:" + key))
+      new_store = signed_cookies.SessionStore(key)
+      self.assertEqual("x" * 1024, new_store["foo"])
+      # Shrinking the session moves it back into the cookie.
+      new_store["foo"] = "y"
+      del settings.SESSION_COOKIE_MAX_SIZE
+      new_store.save()
+      self.assert_(signed_cookies.SEPARATOR in new_store.session_key)
+      self.assertEqual(None, Session.get_by_key_name("k:" + key))
+    finally:
+      if hasattr(settings, "SESSION_COOKIE_MAX_SIZE"):
+        del settings.SESSION_COOKIE_MAX_SIZE
+
+
+class CleanupSessionsTest(unittest.TestCase):
+  """Tests the expired session sweeper."""
+
+  def setUp(self):
+    for session in Session.all().fetch(1000):
+      session.delete()
+    now = datetime.now()
+    for i in range(5):
+      Session(key_name="k:expired%d" % i, session_data="",
+              expire_date=now - timedelta(hours=1)).put()
+    for i in range(2):
+      Session(key_name="k:live%d" % i, session_data="",
+              expire_date=now + timedelta(hours=1)).put()
+
+  def testDeleteExpiredSessions(self):
+    """Tests that only expired sessions are deleted, in batches."""
+    checkpoints = []
+    deleted = cleanup_sessions.delete_expired_sessions(
+        batch_size=2,
+        checkpoint=lambda cutoff, cursor: checkpoints.append(cursor))
+    self.assertEqual(5, deleted)
+    self.assertEqual(3, len(checkpoints))
+    self.assertEqual(2, Session.all().count())
+
+  def testResumeFromCheckpoint(self):
+    """Tests that a sweep can be resumed from a saved cursor."""
+    checkpoints = []
+    def _Checkpoint(cutoff, cursor):
+      checkpoints.append((cutoff, cursor))
+      raise KeyboardInterrupt
+    self.assertRaises(KeyboardInterrupt,
+                      cleanup_sessions.delete_expired_sessions,
+                      batch_size=2, checkpoint=_Checkpoint)
+    self.assertEqual(5, Session.all().count())
+    cutoff, cursor = checkpoints[0]
+    deleted = cleanup_sessions.delete_expired_sessions(cutoff, cursor,
+                                                       batch_size=2)
+    self.assertEqual(3, deleted)
+    self.assertEqual(2, Session.all().count())
+
+  def testReadCheckpoint(self):
+    """Tests reading saved, missing and truncated checkpoints."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(temp_dir, "checkpoint")
+      self.assertEqual(None, cleanup_sessions.read_checkpoint(path))
+      cutoff = datetime(2008, 5, 13)
+      cleanup_sessions.write_checkpoint(path, cutoff, "cursor")
+      self.assertEqual((cutoff, "cursor"),
+                       cleanup_sessions.read_checkpoint(path))
+      open(path, "wb").close()
+      self.assertEqual(None, cleanup_sessions.read_checkpoint(path))
+    finally:
+      shutil.rmtree(temp_dir)
+
+
+class SessionKeyLayoutTest(unittest.TestCase):
+  """Tests the session key layouts."""
+
+  def tearDown(self):
+    if hasattr(settings, "SESSION_KEY_LAYOUT"):
+      del settings.SESSION_KEY_LAYOUT
+
+  def testHashedLayout(self):
+    """Tests that sessions are stored under a hashed key name."""
+    settings.SESSION_KEY_LAYOUT = "hashed"
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    key_name = get_key_layout().key_name(store.session_key)
+    self.assert_(key_name.startswith("x:"))
+    self.assert_(Session.get_by_key_name(key_name))
+    self.assertEqual("bar", db.SessionStore(store.session_key)["foo"])
+
+  def testMigrateLegacySession(self):
+    """Tests that legacy sessions are read and moved to the new layout."""
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    settings.SESSION_KEY_LAYOUT = "hashed"
+    new_store = db.SessionStore(store.session_key)
+    self.assertEqual("bar", new_store["foo"])
+    new_store["foo"] = "baz"
+    new_store.save()
+    self.assertEqual(None, Session.get_by_key_name("k:" + store.session_key))
+    key_name = get_key_layout().key_name(store.session_key)
+    self.assert_(Session.get_by_key_name(key_name))
+
+  def testHourlyLayout(self):
+    """Tests that hourly buckets can be dropped by the sweeper."""
+    settings.SESSION_KEY_LAYOUT = "hourly"
+    store = db.SessionStore()
+    store.create()
+    self.assert_(get_key_layout().key_name(store.session_key))
+    self.assertEqual(0, cleanup_sessions.delete_session_buckets(
+        datetime.now() - timedelta(hours=1)))
+    self.assert_(store.exists(store.session_key))
+    self.assertEqual(1, cleanup_sessions.delete_session_buckets(
+        datetime.now() + timedelta(hours=1)))
+    self.failIf(store.exists(store.session_key))
+
+
+class SessionCodecTest(unittest.TestCase):
+  """Tests the binary session codecs."""
+
+  def tearDown(self):
+    if hasattr(settings, "SESSION_CODEC"):
+      del settings.SESSION_CODEC
+
+  def testBinaryCodecs(self):
+    """Tests that the binary codecs round trip and shrink sessions."""
+    session = {"foo": "bar" * 100}
+    legacy = db.SessionStore().encode(session)
+    for name in ("binary", "zlib"):
+      settings.SESSION_CODEC = name
+      store = db.SessionStore()
+      encoded = store.encode(session)
+      self.assert_(codec.is_binary(encoded))
+      self.assert_(len(encoded) < len(legacy))
+      self.assertEqual(session, store.decode(encoded))
+
+  def testDecodeLegacySession(self):
+    """Tests that legacy sessions are still read after switching codec."""
+    store = db.SessionStore()
+    store["foo"] = "bar"
+    store.save()
+    settings.SESSION_CODEC = "zlib"
+    self.assertEqual("bar", db.SessionStore(store.session_key)["foo"])
+
+  def testTamperedSession(self):
+    """Tests that tampered binary sessions are rejected."""
+    settings.SESSION_CODEC = "binary"
+    encoded = db.SessionStore().encode({"foo": "bar"})
+    tampered = encoded[:-1] + chr((ord(encoded[-1]) + 1) % 256)
+    self.assertRaises(SuspiciousOperation, codec.decode, tampered)
@@ -0,0 +1,132 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests importing modules from a bytecode snapshot."""
+
+
+import imp
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from appengine_django import snapshot
+
+
+PACKAGE = "snapshot_test_package"
+
+FILES = {
+    "__init__.py": "from snapshot_test_package import module\n",
+    "module.py": "def value():\n  return 42\n",
+    "broken.py": "def broken(:\n",
+    "data/not_a_package.py": "",
+}
+
+
+class SnapshotTest(unittest.TestCase):
+  """Tests building and importing from a bytecode snapshot."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.package_dir = os.path.join(self.temp_dir, PACKAGE)
+    os.makedirs(os.path.join(self.package_dir, "data"))
+    for name, data in FILES.items():
+      self.writeSource(name, data)
+    self.snapshot_path = os.path.join(self.temp_dir, "bytecode.snapshot")
+    self.modules = [(PACKAGE, os.path.join(self.package_dir, "__init__.py"))]
+    sys.path.insert(0, self.temp_dir)
+    self.importer = None
+
+  def tearDown(self):
+    sys.path.remove(self.temp_dir)
+    if self.importer in sys.meta_path:
+      sys.meta_path.remove(self.importer)
+    for name in sys.modules.keys():
+      if name.startswith(PACKAGE):
+        del sys.modules[name]
+    shutil.rmtree(self.temp_dir)
+
+  def writeSource(self, name, data):
+    source = open(os.path.join(self.package_dir, name), "w")
+    source.write(data)
+    source.close()
+
+  def testBuildSnapshot(self):
+    """Tests that the package's modules are saved to the snapshot."""
+    count, size, failed = snapshot.build_snapshot(self.modules,
+                                                  self.snapshot_path)
+    self.assertEqual(2, count)
+    self.assertEqual(os.path.getsize(self.snapshot_path), size)
+    self.assertEqual([os.path.join(self.package_dir, "broken.py")], failed)
+    importer = snapshot.load_snapshot(self.snapshot_path)
+    self.assertEqual([PACKAGE, PACKAGE + ".module"], sorted(importer.index))
+
+  def testImport(self):
+    """Tests that modules are imported from the snapshot."""
+    snapshot.build_snapshot(self.modules, self.snapshot_path)
+    self.importer = snapshot.load_snapshot(self.snapshot_path)
+    sys.meta_path.append(self.importer)
+    from snapshot_test_package import module
+    self.assertEqual(42, module.value())
+    self.assertEqual(os.path.join(self.temp_dir, PACKAGE, "module.py"),
+                     module.__file__)
+    # Code compiled from source would have the absolute path of the source.
+    self.assertEqual(os.path.join(PACKAGE, "module.py"),
+                     module.value.func_code.co_filename)
+
+  def testChangedSource(self):
+    """Tests that changed modules are not imported from the snapshot."""
+    snapshot.build_snapshot(self.modules, self.snapshot_path)
+    self.importer = snapshot.load_snapshot(self.snapshot_path)
+    self.writeSource("module.py", "def value():\n  return 43\n")
+    self.assertEqual(None, self.importer.find_module(PACKAGE + ".module",
+                                                     [self.package_dir]))
+    self.assert_(self.importer.find_module(PACKAGE) is self.importer)
+
+  def testShadowedSource(self):
+    """Tests that modules shadowed by an extension module are not imported."""
+    snapshot.build_snapshot(self.modules, self.snapshot_path)
+    self.importer = snapshot.load_snapshot(self.snapshot_path)
+    self.writeSource("module.so", "")
+    self.assertEqual(None, self.importer.find_module(PACKAGE + ".module",
+                                                     [self.package_dir]))
+
+  def testOtherPathEntry(self):
+    """Tests that packages found in another sys.path entry are not imported."""
+    snapshot.build_snapshot(self.modules, self.snapshot_path)
+    self.importer = snapshot.load_snapshot(self.snapshot_path)
+    self.assertEqual(os.curdir, self.importer.index[PACKAGE][5])
+    other_dir = os.path.join(self.temp_dir, "other")
+    shutil.copytree(self.package_dir, os.path.join(other_dir, PACKAGE))
+    sys.path.insert(0, other_dir)
+    try:
+      self.assertEqual(None, self.importer.find_module(PACKAGE))
+    finally:
+      sys.path.remove(other_dir)
+
+  def testMagicNumber(self):
+    """Tests that snapshots for another bytecode format are not loaded."""
+    snapshot.build_snapshot(self.modules, self.snapshot_path)
+    header, index = marshal.load(open(self.snapshot_path, "rb"))
+    self.assertEqual(imp.get_magic(), header)
+    data = open(self.snapshot_path, "rb").read()
+    output = open(self.snapshot_path, "wb")
+    output.write(marshal.dumps(("\0\0\0\0", index)) +
+                 data[len(marshal.dumps((header, index))):])
+    output.close()
+    self.assertEqual(None, snapshot.load_snapshot(self.snapshot_path))
@@ -0,0 +1,118 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the startup of the helper.
+
+Each startup is run in a fresh child process so that the results include
+every import made while the helper is installed.
+"""
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import appengine_django
+from appengine_django.management.commands import startup_profile
+
+
+# Installs the helper and prints the time taken and the number of modules
+# imported, followed by whether the serialization modules were imported.
+STARTUP_SCRIPT = """
+import sys
+import time
+start = time.time()
+from appengine_django import InstallAppengineHelperForDjango
+InstallAppengineHelperForDjango(lazy=%s)
+print time.time() - start
+print len(sys.modules)
+print 'django.core.serializers' in sys.modules
+import django.core.serializers
+from django.core.serializers import python
+from appengine_django.serializer.python import Deserializer
+print python.Deserializer is Deserializer
+"""
+
+
+def run_startup(lazy):
+  """Installs the helper in a child process.
+
+  Returns:
+    A tuple of (seconds, modules_imported, serializers_imported,
+    serializers_patched).
+
+  Raises:
+    AssertionError, including the child's stderr, if the child fails.
+  """
+  child = subprocess.Popen([sys.executable, "-c", STARTUP_SCRIPT % lazy],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           cwd=os.getcwdu())
+  stdout, stderr = child.communicate()
+  lines = stdout.split()
+  if child.returncode or len(lines) != 4:
+    raise AssertionError("Startup failed with exit status %s:\n%s" %
+                         (child.returncode, stderr))
+  return float(lines[0]), int(lines[1]), lines[2] == "True", lines[3] == "True"
+
+
+class StartupTest(unittest.TestCase):
+  """Tests eager and lazy installation of the helper."""
+
+  def testLazyInstall(self):
+    """Tests that lazy installation defers patching until first import."""
+    seconds, modules, imported, patched = run_startup(True)
+    self.failIf(imported)
+    self.assert_(patched)
+
+  def testEagerInstall(self):
+    """Tests that eager installation patches everything up front."""
+    seconds, modules, imported, patched = run_startup(False)
+    self.assert_(imported)
+    self.assert_(patched)
+
+  def testLazyImportsFewerModules(self):
+    """Tests that lazy installation imports fewer modules than eager."""
+    eager_modules = run_startup(False)[1]
+    lazy_modules = run_startup(True)[1]
+    self.assert_(lazy_modules < eager_modules,
+                 "lazy installation imported %d modules, eager %d" %
+                 (lazy_modules, eager_modules))
+
+  def testStartupProfile(self):
+    """Tests that every installation phase is recorded."""
+    phases = [record["phase"] for record in startup_profile.profile_startup()]
+    for phase in ("LoadSdk", "LoadDjango", "LoadAppengineEnvironment",
+                  "ModifyAvailableCommands"):
+      self.assert_(phase in phases, "%s missing from %s" % (phase, phases))
+
+  def testSdkCache(self):
+    """Tests that the saved SDK location is discarded when the SDK changes."""
+    temp_dir = tempfile.mkdtemp()
+    sdk_path = os.path.join(temp_dir, "google_appengine")
+    cache_path = os.path.join(temp_dir, "cache")
+    os.mkdir(sdk_path)
+    try:
+      extra_paths = [sdk_path, os.path.join(sdk_path, "lib")]
+      self.assertEqual(None, appengine_django.ReadSdkCache(cache_path))
+      appengine_django.WriteSdkCache(extra_paths, cache_path)
+      self.assertEqual(extra_paths, appengine_django.ReadSdkCache(cache_path))
+      os.utime(sdk_path, (0, 0))
+      self.assertEqual(None, appengine_django.ReadSdkCache(cache_path))
+    finally:
+      shutil.rmtree(temp_dir)
@@ -0,0 +1,52 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the warmup request handler."""
+
+
+import unittest
+
+from django import http
+
+from appengine_django import warmup
+
+
+class WarmupTest(unittest.TestCase):
+  """Tests that the warmup runs each step and reports its timings."""
+
+  def setUp(self):
+    self.signalled = []
+
+  def onWarmup(self, sender, **kwargs):
+    self.signalled.append(sender)
+
+  def testWarmup(self):
+    """Tests that every step is run and timed."""
+    warmup.warming_up.connect(self.onWarmup)
+    try:
+      timings = warmup.warmup()
+    finally:
+      warmup.warming_up.disconnect(self.onWarmup)
+    self.assertEqual([None], self.signalled)
+    self.assertEqual(["import_urlconf", "import_middleware", "import_models",
+                      "compile_templates", "warming_up", "total"],
+                     [name for name, seconds in timings])
+
+  def testWarmupView(self):
+    """Tests that the view reports the total time taken."""
+    response = warmup.warmup_view(http.HttpRequest())
+    self.assertEqual(200, response.status_code)
+    self.assert_("total: " in response.content)
@@ -0,0 +1,114 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests importing modules from a zipfile using a precomputed index."""
+
+
+import imp
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+import zipimport
+
+from appengine_django import zipindex
+
+
+PACKAGE = "zipindex_test_package"
+
+FILES = {
+    PACKAGE + "/__init__.py": "from zipindex_test_package import module\n",
+    PACKAGE + "/module.py": "VALUE = 42\r\n",
+    PACKAGE + "/management/__init__.py": "",
+    PACKAGE + "/management/commands/__init__.py": "",
+    PACKAGE + "/management/commands/first.py": "",
+    PACKAGE + "/management/commands/_private.py": "",
+    PACKAGE + "/data.txt": "not a module",
+}
+
+# A module that is only present in the zip as bytecode.
+COMPILED_FILENAME = PACKAGE + "/compiled.pyc"
+
+
+def compile_module(source, filename):
+  """Returns the contents of a .pyc file for the source."""
+  code = compile(source, filename, "exec")
+  return imp.get_magic() + "\0\0\0\0" + marshal.dumps(code)
+
+
+class ZipIndexTest(unittest.TestCase):
+  """Tests building and importing using a zipfile index."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.zip_path = os.path.join(self.temp_dir, "test.zip")
+    archive = zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED)
+    for name, data in FILES.items():
+      archive.writestr(name, data)
+    archive.writestr(COMPILED_FILENAME,
+                     compile_module("VALUE = 7\n", COMPILED_FILENAME))
+    archive.close()
+    self.importer = None
+
+  def tearDown(self):
+    if self.importer in sys.meta_path:
+      sys.meta_path.remove(self.importer)
+    for name in sys.modules.keys():
+      if name.startswith(PACKAGE):
+        del sys.modules[name]
+    shutil.rmtree(self.temp_dir)
+
+  def testBuildIndex(self):
+    """Tests that the index lists the modules and commands in the zip."""
+    index = zipindex.build_index(self.zip_path)
+    self.assertEqual(index, zipindex.load_index(self.zip_path))
+    self.assertEqual([PACKAGE, PACKAGE + ".management",
+                      PACKAGE + ".management.commands",
+                      PACKAGE + ".management.commands._private",
+                      PACKAGE + ".management.commands.first",
+                      PACKAGE + ".module"], sorted(index["modules"]))
+    self.assertEqual({PACKAGE + "/management": ["first"]}, index["commands"])
+
+  def testImport(self):
+    """Tests that modules are imported from the zip using the index."""
+    zipindex.build_index(self.zip_path)
+    self.importer = zipindex.install(self.zip_path)
+    from zipindex_test_package import module
+    self.assertEqual(42, module.VALUE)
+    self.assert_(module.__loader__ is self.importer)
+    self.assertEqual(os.path.join(self.zip_path, PACKAGE, "module.py"),
+                     module.__file__)
+
+  def testCompiledModule(self):
+    """Tests that modules missing from the index are found with zipimport."""
+    zipindex.build_index(self.zip_path)
+    self.importer = zipindex.install(self.zip_path)
+    from zipindex_test_package import compiled
+    self.assertEqual(7, compiled.VALUE)
+    self.assert_(isinstance(compiled.__loader__, zipimport.zipimporter))
+    self.assertEqual(None, self.importer.find_module(PACKAGE + ".missing"))
+
+  def testStaleIndex(self):
+    """Tests that the index is ignored once the zip has changed."""
+    zipindex.build_index(self.zip_path)
+    archive = zipfile.ZipFile(self.zip_path, "a")
+    archive.writestr(PACKAGE + "/added.py", "")
+    archive.close()
+    self.assertEqual(None, zipindex.load_index(self.zip_path))
+    self.assertEqual(None, zipindex.install(self.zip_path))
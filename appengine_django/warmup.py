@@ -0,0 +1,114 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prepares a new instance before it serves its first request.
+
+App Engine sends a request to /_ah/warmup to new instances when warmup is
+enabled in app.yaml:
+
+  inbound_services:
+  - warmup
+
+and the view is added to urls.py:
+
+  (r'^_ah/warmup$', 'appengine_django.warmup.warmup_view'),
+
+The warmup imports the URLconf and the views it refers to, the middleware and
+the models of every installed app, and compiles the templates listed in the
+WARMUP_TEMPLATES setting. Compiled templates are only kept if a caching
+template loader is in use. Applications can do further work by connecting to
+the warming_up signal.
+"""
+
+import logging
+import time
+
+from django import http
+from django.conf import settings
+from django.core import urlresolvers
+from django.dispatch import Signal
+
+
+# Sent after the built in warmup steps have run.
+warming_up = Signal()
+
+
+def _import_urlconf(resolver):
+  """Imports the URLconf, included URLconfs and views of a resolver."""
+  for pattern in resolver.url_patterns:
+    try:
+      if isinstance(pattern, urlresolvers.RegexURLResolver):
+        _import_urlconf(pattern)
+      else:
+        pattern.callback
+    except (ImportError, urlresolvers.ViewDoesNotExist), e:
+      logging.warning("Warmup could not import %s: %s" % (pattern, e))
+
+
+def import_urlconf():
+  _import_urlconf(urlresolvers.get_resolver(None))
+
+
+def import_middleware():
+  for middleware_path in settings.MIDDLEWARE_CLASSES:
+    module, classname = middleware_path.rsplit(".", 1)
+    getattr(__import__(module, {}, {}, [classname]), classname)
+
+
+def import_models():
+  # Importing the models of an app creates its classes, which are registered
+  # with Django by PropertiedClassWithDjango.
+  from django.db.models.loading import get_models
+  get_models()
+
+
+def compile_templates():
+  from django.template import loader
+  for template_name in getattr(settings, "WARMUP_TEMPLATES", ()):
+    loader.get_template(template_name)
+
+
+WARMUP_STEPS = (import_urlconf, import_middleware, import_models,
+                compile_templates)
+
+
+def warmup():
+  """Runs each warmup step and then sends the warming_up signal.
+
+  Returns:
+    A list of (step name, seconds) tuples, ending with the total.
+  """
+  timings = []
+  start = time.time()
+  for step in WARMUP_STEPS:
+    step_start = time.time()
+    step()
+    timings.append((step.__name__, time.time() - step_start))
+  step_start = time.time()
+  warming_up.send(sender=None)
+  timings.append(("warming_up", time.time() - step_start))
+  timings.append(("total", time.time() - start))
+  logging.info("Warmup took %s" % ", ".join(
+      ["%s=%.1fms" % (name, seconds * 1000) for name, seconds in timings]))
+  return timings
+
+
+def warmup_view(request):
+  """Warms up the instance and reports the time taken by each step."""
+  timings = warmup()
+  return http.HttpResponse(
+      "".join(["%s: %.1fms\n" % (name, seconds * 1000)
+               for name, seconds in timings]), mimetype="text/plain")
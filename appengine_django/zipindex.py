@@ -0,0 +1,219 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2008 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast imports from django.zip using a precomputed index.
+
+Importing from a zipfile on sys.path makes zipimport read and parse the
+archive's whole directory before the first module can be loaded. An index
+built ahead of time with ./manage.py index_django_zip records where each
+module's source starts within the archive, so that modules can be read with a
+single seek and read instead. The index also records the management commands
+provided by the archive.
+
+Only source members are indexed. Other modules in the indexed packages, such as
+those only present as compiled bytecode, are imported with zipimport.
+
+The index is stored next to the archive (django.zip.index) and must be
+uploaded with the application. It is ignored if the archive changes after the
+index was built.
+
+This module must not import Django as it is used to load Django.
+"""
+
+import marshal
+import os
+import struct
+import sys
+import types
+import zipfile
+import zipimport
+import zlib
+
+
+INDEX_VERSION = 1
+
+# The number of bytes at the end of the archive that are recorded in the index
+# and compared to detect a changed archive. This covers the end of central
+# directory record which includes the size and offset of the directory.
+TRAILER_SIZE = 22
+
+
+def get_index_path(zip_path):
+  """Returns the path of the index for the archive at zip_path."""
+  return zip_path + ".index"
+
+
+def _read_trailer(zip_path):
+  archive = open(zip_path, "rb")
+  try:
+    archive.seek(-TRAILER_SIZE, 2)
+    return archive.read()
+  finally:
+    archive.close()
+
+
+def build_index(zip_path, index_path=None):
+  """Writes an index of the modules and commands in the archive at zip_path.
+
+  Returns:
+    The index, a dictionary with the following keys:
+      version: INDEX_VERSION.
+      trailer: The last TRAILER_SIZE bytes of the archive.
+      modules: Maps module names to a tuple of (path within the archive,
+        is_package, offset of the data, compression type, compressed size).
+      commands: Maps the path of each management directory within the archive
+        to the names of the commands it contains.
+  """
+  modules = {}
+  commands = {}
+  archive = zipfile.ZipFile(zip_path)
+  try:
+    raw = open(zip_path, "rb")
+    try:
+      for info in archive.infolist():
+        name = info.filename.replace("\\", "/")
+        if not name.endswith(".py"):
+          continue
+        # The data follows the local file header, whose variable length fields
+        # may differ from those in the central directory.
+        raw.seek(info.header_offset)
+        header = raw.read(zipfile.sizeFileHeader)
+        fields = struct.unpack(zipfile.structFileHeader, header)
+        offset = (info.header_offset + zipfile.sizeFileHeader +
+                  fields[zipfile._FH_FILENAME_LENGTH] +
+                  fields[zipfile._FH_EXTRA_FIELD_LENGTH])
+        entry = (info.filename, False, offset, info.compress_type,
+                 info.compress_size)
+        parts = name[:-3].split("/")
+        if parts[-1] == "__init__":
+          modules[".".join(parts[:-1])] = (entry[0], True) + entry[2:]
+        else:
+          modules[".".join(parts)] = entry
+        if len(parts) > 2 and parts[-2] == "commands" and \
+            not parts[-1].startswith("_"):
+          management_dir = "/".join(parts[:-2])
+          commands.setdefault(management_dir, []).append(parts[-1])
+    finally:
+      raw.close()
+  finally:
+    archive.close()
+  index = {"version": INDEX_VERSION, "trailer": _read_trailer(zip_path),
+           "modules": modules, "commands": commands}
+  index_file = open(index_path or get_index_path(zip_path), "wb")
+  try:
+    marshal.dump(index, index_file)
+  finally:
+    index_file.close()
+  return index
+
+
+def load_index(zip_path, index_path=None):
+  """Returns the index for the archive at zip_path, or None.
+
+  None is returned if there is no index or it was built for a different
+  version of the archive.
+  """
+  try:
+    index_file = open(index_path or get_index_path(zip_path), "rb")
+    try:
+      index = marshal.load(index_file)
+    finally:
+      index_file.close()
+    if (index.get("version") == INDEX_VERSION and
+        index.get("trailer") == _read_trailer(zip_path)):
+      return index
+  except (IOError, EOFError, ValueError, TypeError, AttributeError), e:
+    pass
+  return None
+
+
+class ZipIndexImporter(object):
+  """Imports the modules in an archive using its index.
+
+  The importer is installed on sys.meta_path and is also used as the path
+  importer for the packages it loads, so that the implicit relative imports
+  made by those packages do not cause zipimport to read the archive. Modules
+  in those packages that are missing from the index are found with zipimport.
+  """
+
+  def __init__(self, zip_path, index):
+    self.archive = zip_path
+    self.modules = index["modules"]
+    self.commands = index["commands"]
+    self._zipimporters = {}
+
+  def find_module(self, fullname, path=None):
+    if fullname in self.modules:
+      return self
+    package = fullname[:max(fullname.rfind("."), 0)]
+    if package in self.modules and self.modules[package][1]:
+      return self._get_zipimporter(package).find_module(fullname)
+    return None
+
+  def _get_zipimporter(self, package):
+    """Returns a zipimporter for the directory of an indexed package."""
+    if package not in self._zipimporters:
+      package_dir = os.path.dirname(self.modules[package][0])
+      self._zipimporters[package] = zipimport.zipimporter(
+          os.path.join(self.archive, package_dir))
+    return self._zipimporters[package]
+
+  def get_source(self, fullname):
+    """Returns the source of the module, used for tracebacks."""
+    filename, is_package, offset, compress_type, size = self.modules[fullname]
+    archive = open(self.archive, "rb")
+    try:
+      archive.seek(offset)
+      data = archive.read(size)
+    finally:
+      archive.close()
+    if compress_type == zipfile.ZIP_DEFLATED:
+      data = zlib.decompress(data, -15)
+    return data.replace("\r\n", "\n")
+
+  def load_module(self, fullname):
+    if fullname in sys.modules:
+      return sys.modules[fullname]
+    filename, is_package = self.modules[fullname][:2]
+    path = os.path.join(self.archive, filename)
+    code = compile(self.get_source(fullname) + "\n", path, "exec")
+    module = sys.modules.setdefault(fullname, types.ModuleType(fullname))
+    module.__file__ = path
+    module.__loader__ = self
+    if is_package:
+      package_dir = os.path.dirname(path)
+      module.__path__ = [package_dir]
+      sys.path_importer_cache[package_dir] = self
+    try:
+      exec code in module.__dict__
+    except:
+      del sys.modules[fullname]
+      raise
+    return sys.modules[fullname]
+
+
+def install(zip_path):
+  """Installs an importer for the archive at zip_path if it has an index.
+
+  Returns:
+    The installed ZipIndexImporter, or None if the archive has no valid index.
+  """
+  index = load_index(zip_path)
+  if index is None:
+    return None
+  importer = ZipIndexImporter(zip_path, index)
+  sys.meta_path.append(importer)
+  return importer
@@ -26,25 +26,29 @@ import sys
 import logging
 
 from appengine_django import InstallAppengineHelperForDjango
-InstallAppengineHelperForDjango()
+InstallAppengineHelperForDjango(lazy=True)
 
 from appengine_django import have_django_zip
+from appengine_django import django_zip_importer
 from appengine_django import django_zip_path
 
 # Google App Engine imports.
 from google.appengine.ext.webapp import util
 
+# Ensure the Django zipfile is in the path if required. This is unnecessary
+# when Django is imported using the zipfile's index.
+if (have_django_zip and django_zip_importer is None and
+    django_zip_path not in sys.path):
+  sys.path.insert(1, django_zip_path)
+
 # Import the part of Django that we use here.
 import django.core.handlers.wsgi
 
-def main():
-  # Ensure the Django zipfile is in the path if required.
-  if have_django_zip and django_zip_path not in sys.path:
-    sys.path.insert(1, django_zip_path)
-
-  # Create a Django application for WSGI.
-  application = django.core.handlers.wsgi.WSGIHandler()
+# The Django application for WSGI. It is created once per instance and reused
+# by every request so that the middleware is only loaded once.
+application = django.core.handlers.wsgi.WSGIHandler()
 
+def main():
   # Run the WSGI CGI handler with that application.
   util.run_wsgi_app(application)
 
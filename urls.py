@@ -15,6 +15,9 @@
 from django.conf.urls.defaults import *
 
 urlpatterns = patterns('',
+    # Prepares new instances, see appengine_django/warmup.py.
+    (r'^_ah/warmup$', 'appengine_django.warmup.warmup_view'),
+
     # Example:
     # (r'^foo/', include('foo.urls')),
 